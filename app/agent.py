@@ -1,20 +1,249 @@
 import os
+import re
 import json
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
-from typing import List, Optional
-from langchain_core.tools import Tool
-import google.generativeai as genai
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from policy import RetrievalPolicy
+from answer_cache import context_fingerprint
+from tokens import count_tokens, truncate_tokens
+import tracing
 
 load_dotenv()
 
-class Agent:
-    def __init__(self, rag_system=None, tools: Optional[object] = None, memory=None):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            raise ValueError("Falta GEMINI_API_KEY en .env")
+def create_gemini_model(model_name: str = "gemini-1.5-flash"):
+    """Configura la API de Gemini y crea el modelo. Se puede crear una vez por proceso
+    y compartir entre todos los agentes de sesión."""
+    import google.generativeai as genai  # import pesado: sólo cuando se crea el modelo
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("Falta GEMINI_API_KEY en .env")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+# Errores transitorios del proveedor (google.api_core): se reintentan con backoff
+RETRYABLE_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+                    "InternalServerError", "GatewayTimeout", "Aborted"}
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMOverloadedError(RuntimeError):
+    """La cola del limitador está llena o no se consiguió turno a tiempo."""
+
+
+def _is_retryable(error: BaseException) -> bool:
+    if isinstance(error, LLMOverloadedError):
+        return False
+    code = getattr(error, "code", None)
+    return type(error).__name__ in RETRYABLE_ERRORS or (isinstance(code, int) and code in RETRYABLE_STATUS)
+
+
+class TokenBucket:
+    """Limitador del lado del cliente: `rate` llamadas por segundo con ráfagas de hasta `capacity`.
+    Como mucho max_waiters hilos esperan turno; el resto se rechaza enseguida."""
+
+    def __init__(self, rate: float, capacity: float, max_waiters: int = 32):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_waiters = max_waiters
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.waiters = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """Toma un turno y devuelve cuántos segundos hubo que esperarlo."""
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        queued = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                    self.updated_at = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return now - start
+                    if not queued:
+                        if self.waiters >= self.max_waiters:
+                            raise LLMOverloadedError("Demasiadas consultas en espera para el modelo")
+                        self.waiters += 1
+                        queued = True
+                    wait = (1 - self.tokens) / self.rate
+                if deadline is not None and now + wait > deadline:
+                    raise LLMOverloadedError("No se obtuvo turno para el modelo a tiempo")
+                time.sleep(wait)
+        finally:
+            if queued:
+                with self._lock:
+                    self.waiters -= 1
+
+
+class LLMGateway:
+    """Punto único de salida hacia el modelo, compartido por todas las sesiones del proceso.
+
+    - Single-flight: si el mismo prompt ya está en vuelo, las demás llamadas esperan ese
+      resultado en vez de repetir la llamada.
+    - Token bucket (GEMINI_RPM, GEMINI_BURST) con cola acotada (GEMINI_MAX_QUEUE).
+    - Reintentos con backoff exponencial con jitter (tenacity) ante errores transitorios.
+    - Latencia, reintentos y tokens consumidos por llamada, para stats().
+    """
+
+    def __init__(self, model, requests_per_minute: Optional[float] = None, burst: Optional[int] = None,
+                 max_queue: Optional[int] = None, max_attempts: int = 4, queue_timeout: float = 30.0):
+        self.model = model
+        rpm = requests_per_minute or float(os.getenv("GEMINI_RPM", 60))
+        self.limiter = TokenBucket(rate=rpm / 60.0, capacity=burst or int(os.getenv("GEMINI_BURST", 5)),
+                                   max_waiters=max_queue or int(os.getenv("GEMINI_MAX_QUEUE", 32)))
+        self.max_attempts = max_attempts
+        self.queue_timeout = queue_timeout
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.latencies: deque = deque(maxlen=1000)
+        self.counters = {"calls": 0, "streams": 0, "coalesced": 0, "retries": 0, "errors": 0, "rejected": 0,
+                         "queue_wait_s": 0.0, "prompt_tokens": 0, "output_tokens": 0}
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self.counters[key] += value
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self._count(prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+                        output_tokens=getattr(usage, "candidates_token_count", 0) or 0)
+
+    def _retrying(self, retryable=_is_retryable) -> Retrying:
+        def before_sleep(retry_state):
+            self._count(retries=1)
+            logging.warning(f"⚠️ [LLM] Intento {retry_state.attempt_number} falló "
+                            f"({retry_state.outcome.exception()}), reintentando")
+
+        return Retrying(stop=stop_after_attempt(self.max_attempts), wait=wait_random_exponential(multiplier=0.5, max=8),
+                        retry=retry_if_exception(retryable), before_sleep=before_sleep, reraise=True)
+
+    def _acquire(self):
+        try:
+            self._count(queue_wait_s=self.limiter.acquire(timeout=self.queue_timeout))
+        except LLMOverloadedError:
+            self._count(rejected=1)
+            raise
+
+    def _call(self, prompt: str) -> str:
+        start = time.perf_counter()
+        try:
+            for attempt in self._retrying():
+                with attempt:
+                    self._acquire()
+                    response = self.model.generate_content(prompt)
+                    text = response.text
+        except Exception:
+            self._count(errors=1)
+            raise
+        self._record_usage(response)
+        with self._stats_lock:
+            self.latencies.append(time.perf_counter() - start)
+        return text
+
+    def generate(self, prompt: str) -> str:
+        key = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        self._count(calls=1)
+        if not leader:
+            self._count(coalesced=1)
+            return future.result()
+        try:
+            future.set_result(self._call(prompt))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return future.result()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Streaming no se comparte entre llamadas; se reintenta sólo si falla antes del primer fragmento."""
+        self._count(calls=1, streams=1)
+        start = time.perf_counter()
+        emitted = False
+        try:
+            # Una vez entregado texto al cliente, reintentar duplicaría la respuesta
+            for attempt in self._retrying(lambda e: not emitted and _is_retryable(e)):
+                with attempt:
+                    self._acquire()
+                    response = self.model.generate_content(prompt, stream=True)
+                    chunk = None
+                    for chunk in response:
+                        text = getattr(chunk, "text", "")
+                        if text:
+                            emitted = True
+                            yield text
+                    self._record_usage(chunk)
+                    if emitted:
+                        break
+        except Exception:
+            self._count(errors=1)
+            raise
+        with self._stats_lock:
+            self.latencies.append(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            latencies = np.asarray(self.latencies) * 1000
+            stats = dict(self.counters)
+        stats["queue_depth"] = self.limiter.waiters
+        stats["inflight"] = len(self._inflight)
+        if len(latencies):
+            stats.update({"latency_p50_ms": float(np.percentile(latencies, 50)),
+                          "latency_p95_ms": float(np.percentile(latencies, 95))})
+        return stats
+
+
+HISTORY_ROLES = {"user": "Usuario", "assistant": "Asistente"}
+
+# Repreguntas que se apoyan en la conversación ("¿y en Civil?", "¿cuántas horas tiene esa?"):
+# su respuesta depende del historial, así que no se reutilizan ni se guardan en el cache
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\W*(y|e|pero|entonces|tambi[eé]n)\b"
+    r"|\b(eso|esto|aquello|ese|esa|esos|esas|dich[oa]s?|mism[oa]s?|anterior(es)?|otr[oa]s?)\b"
+)
+
+SUMMARY_PROMPT = (
+    "Resumí la conversación entre un estudiante y el asistente del Centro de Estudiantes para usarla como memoria. "
+    "Conservá los datos útiles para próximas preguntas (carrera, año, materias, trámites consultados, preferencias) "
+    "y omití saludos y detalles ya irrelevantes. Máximo {words} palabras.\n\n"
+    "Resumen anterior:\n{summary}\n\nMensajes nuevos:\n{turns}\n\nResumen actualizado:"
+)
 
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel("gemini-1.5-flash")
+# Los resúmenes se actualizan fuera del pedido: la respuesta no espera a este LLM extra
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+
+
+class Agent:
+    def __init__(self, rag_system=None, tools: Optional[object] = None, memory=None, model=None):
+        # El modelo, el RAG y las tools son recursos pesados y compartidos; la memoria es por sesión
+        self.model = model or create_gemini_model()
+        # Con un LLMGateway compartido (ver startup.cargar_recursos) el single-flight y el
+        # limitador valen para todo el proceso; un modelo suelto se envuelve en uno propio
+        self.llm = self.model if isinstance(self.model, LLMGateway) else LLMGateway(self.model)
 
         self.rag_system = rag_system
         self.tools = tools or []
@@ -29,30 +258,141 @@ class Agent:
         )
 
         self.memory = memory
+        self.retrieval_policy = RetrievalPolicy()
+        self.max_context_tokens = 1800  # presupuesto del contexto recuperado dentro del prompt
+        # Historial en el prompt: resumen rodante + últimos turnos textuales, con tope fijo de tokens
+        self.history_turns = 3
+        self.history_max_tokens = 600
+        self.summary_max_tokens = 250
+        self.summary_fold_turns = 2  # los turnos viejos se pliegan al resumen de a este número
+        # Consultas puntuales sobre los planes se responden desde el TableStore, sin LLM
+        self.table_lookup = os.getenv("RAG_TABLE_LOOKUP", "on").lower() != "off"
 
-    def process_query(self, query: str, context: str = "", history: Optional[List[dict]] = None) -> str:
-        try:
-            prompt = f"{self.system_prompt}\n\n{context}\n\nUsuario: {query}" if context else f"{self.system_prompt}\n\nUsuario: {query}"
-            response = self.model.generate_content(prompt)
-            response_text = response.text
+    def _build_prompt(self, query: str, context: str = "") -> str:
+        return f"{self.system_prompt}\n\n{context}\n\nUsuario: {query}" if context else f"{self.system_prompt}\n\nUsuario: {query}"
 
-            if self.memory:
+    def _save_turn(self, query: str, response_text: str):
+        if self.memory:
+            with tracing.span("memory"):
                 self.memory.add_message("user", query)
                 self.memory.add_message("assistant", response_text)
+            if hasattr(self.memory, "get_summary"):
+                _summary_executor.submit(self._fold_history)
+
+    @staticmethod
+    def _format_turns(messages: List[dict], max_tokens: int) -> str:
+        """Los mensajes más recientes que entran en max_tokens, en orden cronológico."""
+        lines, used = [], 0
+        for message in reversed(messages):
+            line = f"{HISTORY_ROLES.get(message['role'], message['role'])}: {message['content']}"
+            tokens = count_tokens(line)
+            if used + tokens > max_tokens:
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join(reversed(lines))
+
+    def _build_history(self, history: Optional[List[dict]] = None) -> Tuple[str, str]:
+        """Bloque de historial para el prompt y el resumen usado.
+
+        Con history explícito se usan sus últimos turnos. Si no, se toma de la memoria: el
+        resumen cacheado de los turnos viejos más los mensajes que todavía no resume (los
+        últimos history_turns y, como mucho, un plegado pendiente). Todo entra en
+        history_max_tokens, así que el prompt no crece con la conversación.
+        """
+        summary = ""
+        if history is not None:
+            messages = history[-2 * self.history_turns:]
+        elif self.memory and hasattr(self.memory, "get_summary"):
+            with tracing.span("history"):
+                summary, covered = self.memory.get_summary()
+                messages = self.memory.get_recent(2 * (self.history_turns + self.summary_fold_turns), after_id=covered)
+        else:
+            return "", ""
+        summary = truncate_tokens(summary, self.summary_max_tokens) if summary else ""
+        turns = self._format_turns(messages, self.history_max_tokens - (count_tokens(summary) if summary else 0))
+        parts = []
+        if summary:
+            parts.append(f"[Resumen de la conversación]:\n{summary}")
+        if turns:
+            parts.append(f"[Conversación reciente]:\n{turns}")
+        return "\n\n".join(parts), summary
+
+    def _fold_history(self):
+        """Pliega al resumen los turnos que quedaron fuera de la ventana textual. Es incremental:
+        el LLM recibe el resumen anterior y sólo los mensajes nuevos, y corre recién cuando se
+        juntaron summary_fold_turns turnos."""
+        memory = self.memory
+        if not memory.summary_lock.acquire(blocking=False):
+            return  # otro pedido de la misma sesión ya está resumiendo
+        try:
+            summary, covered = memory.get_summary()
+            recent = memory.get_recent(2 * self.history_turns, after_id=covered)
+            if not recent:
+                return
+            pending = memory.get_messages_between(covered, recent[0]["id"])
+            if len(pending) < 2 * self.summary_fold_turns:
+                return
+            turns = "\n".join(f"{HISTORY_ROLES.get(m['role'], m['role'])}: {truncate_tokens(m['content'], 300)}" for m in pending)
+            prompt = SUMMARY_PROMPT.format(words=int(self.summary_max_tokens * 0.6), summary=summary or "(vacío)", turns=turns)
+            new_summary = truncate_tokens(self.llm.generate(prompt).strip(), self.summary_max_tokens)
+            memory.set_summary(new_summary, pending[-1]["id"])
+            logging.info(f"🧠 Resumen de {memory.user_id} actualizado ({len(pending)} mensajes plegados)")
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo actualizar el resumen de la conversación: {e}")
+        finally:
+            memory.summary_lock.release()
+
+    def process_query(self, query: str, context: str = "", history: Optional[List[dict]] = None) -> str:
+        try:
+            if history:
+                context = self._build_history(history)[0] + context
+            prompt = self._build_prompt(query, context)
+            with tracing.span("llm"):
+                response_text = self.llm.generate(prompt)
+
+            self._save_turn(query, response_text)
 
             return response_text
         except Exception as e:
             return f"Error: {e}"
 
-    def generate_response(self, query: str, history: Optional[List[dict]] = None) -> dict:
+    def stream_query(self, query: str, context: str = "", history: Optional[List[dict]] = None) -> Iterator[str]:
+        """Versión en streaming de process_query: entrega los fragmentos de texto a medida que
+        Gemini los genera. La memoria se guarda una sola vez, cuando el stream terminó completo."""
+        if history:
+            context = self._build_history(history)[0] + context
+        parts = []
+        try:
+            for text in self._generate_stream(query, context):
+                parts.append(text)
+                yield text
+        except Exception as e:
+            yield f"Error: {e}"
+            return
+        self._save_turn(query, "".join(parts))
+
+    def _generate_stream(self, query: str, context: str) -> Iterator[str]:
+        return self.llm.stream(self._build_prompt(query, context))
+
+    def _build_context(self, query: str) -> dict:
         reasoning_steps = []
         context = ""
 
+        decision_path = []
+        confidence_scores = {}
+
         if self.rag_system:
-            doc_context = self.rag_system.get_context(query)
+            with tracing.span("retrieval"):
+                rag_info = self.rag_system.retrieve(query, policy=self.retrieval_policy)
+            decision_path = rag_info["decision_path"]
+            confidence_scores["rag"] = rag_info["confidence"]
+            doc_context = self.rag_system.build_context(rag_info, max_tokens=self.max_context_tokens)
             if doc_context:
                 context += f"\n\n[Contexto RAG]:\n{doc_context}"
                 reasoning_steps.append("Se usó contexto de RAG.")
+            if "web_search" in decision_path:
+                reasoning_steps.append("Se consultó la web (" + " → ".join(decision_path) + ").")
 
         tool_outputs = []
         used_tools = []
@@ -63,7 +403,8 @@ class Agent:
             for tool in tools_list:
                 if self._tool_matches_query(tool.name, query):
                     try:
-                        output = tool.invoke({"query": query})
+                        with tracing.span("tool", tool=tool.name):
+                            output = tool.invoke({"query": query})
                         tool_outputs.append(f"{tool.name} → {output}")
                         used_tools.append(tool.name)
                     except Exception as e:
@@ -73,15 +414,171 @@ class Agent:
                 context += "\n\n[Resultados de herramientas]:\n" + "\n".join(tool_outputs)
                 reasoning_steps.append("Se invocaron herramientas: " + ", ".join(used_tools))
 
-        response = self.process_query(query, context=context, history=history)
-
         return {
-            "response": response,
+            "context": context,
             "reasoning_steps": reasoning_steps,
             "context_used": bool(context),
-            "tools_used": used_tools
+            "tools_used": used_tools,
+            "decision_path": decision_path,
+            "confidence_scores": confidence_scores,
+            "cache_hit": False
         }
 
+    def _table_answer(self, query: str) -> Optional[dict]:
+        """Resultado armado directo desde las tablas de los planes (correlativas, carga horaria,
+        nivel de una materia, materias de un año), o None si la pregunta no es una consulta
+        puntual. Se evalúa antes de la recuperación: no hay embeddings, Chroma ni LLM."""
+        store = getattr(self.rag_system, "table_store", None)
+        if store is None or not self.table_lookup:
+            return None
+        if self.retrieval_policy.is_time_sensitive(query):
+            return None  # fechas, inscripciones: la tabla no alcanza y la respuesta no puede omitirlo
+        with tracing.span("table_lookup") as attrs:
+            try:
+                answer = store.answer(query)
+            except Exception as e:
+                logging.warning(f"⚠️ Falló la consulta al índice de tablas: {e}")
+                answer = None
+            attrs["hit"] = answer is not None
+        if answer is None:
+            return None
+        self._save_turn(query, answer["response"])
+        return {
+            "response": answer["response"],
+            "reasoning_steps": [f"Respuesta exacta desde el plan de estudios ({answer['intent']}, {len(answer['rows'])} filas), sin LLM."],
+            "context_used": True,
+            "tools_used": [],
+            "decision_path": ["table_lookup"],
+            "confidence_scores": {"table": 1.0},
+            "cache_hit": False,
+            "context_summary": "",
+        }
+
+    @staticmethod
+    def _answer_cacheable(query: str, history_block: str, result: dict) -> bool:
+        """La huella del cache es sólo el contexto recuperado: el historial cambia en cada turno.
+        Las repreguntas que dependen de la conversación no buscan ni guardan en el cache."""
+        if history_block and FOLLOW_UP_PATTERN.search(query.lower()):
+            result["reasoning_steps"].append("La pregunta retoma la conversación: no se usó el cache de respuestas.")
+            return False
+        return True
+
+    def _answer_cache_key(self, query: str, context: str) -> Optional[tuple]:
+        """(cache, embedding, huella del contexto, versión de la colección) para el cache
+        semántico de respuestas del RAG, o None si no hay cache."""
+        cache = getattr(self.rag_system, "answer_cache", None)
+        if cache is None:
+            return None
+        return cache, self.rag_system.encode_query(query), context_fingerprint(context), self.rag_system.collection_version
+
+    def _cached_answer(self, query: str, context: str, result: dict) -> Optional[str]:
+        key = self._answer_cache_key(query, context)
+        result["cache_hit"] = False
+        if key is None:
+            return None
+        cache, embedding, fingerprint, version = key
+        with tracing.span("answer_cache") as attrs:
+            hit = cache.get(embedding, fingerprint, version)
+            attrs["hit"] = hit is not None
+        if hit is None:
+            return None
+        result["cache_hit"] = True
+        result["reasoning_steps"].append(f"Respuesta reutilizada del cache (similitud {hit['similarity']:.2f} con \"{hit['query']}\").")
+        self._save_turn(query, hit["response"])
+        return hit["response"]
+
+    def _store_answer(self, query: str, context: str, response_text: str):
+        key = self._answer_cache_key(query, context)
+        if key is None or not response_text or response_text.startswith("Error:"):
+            return
+        cache, embedding, fingerprint, version = key
+        cache.set(embedding, fingerprint, query, response_text, version)
+
+    @staticmethod
+    def _finish_trace(trace: "tracing.Trace", result: dict):
+        """Cierra la traza y deja los tiempos por etapa (ms) y el total (s) en el resultado."""
+        trace.finish()
+        result["timings"] = trace.timings()
+        result["processing_time"] = trace.duration
+        result["trace_id"] = trace.trace_id
+
+    def generate_response(self, query: str, history: Optional[List[dict]] = None) -> dict:
+        trace = tracing.start_trace("generate_response", streaming=False)
+        with tracing.use_trace(trace):
+            result = self._table_answer(query)
+            if result is None:
+                result = self._build_context(query)
+                history_block, result["context_summary"] = self._build_history(history)
+                retrieved = result.pop("context")
+                context = history_block + retrieved
+                cacheable = self._answer_cacheable(query, history_block, result)
+                cached = self._cached_answer(query, retrieved, result) if cacheable else None
+                if cached is not None:
+                    result["response"] = cached
+                else:
+                    result["response"] = self.process_query(query, context=context)
+                    if cacheable:
+                        self._store_answer(query, retrieved, result["response"])
+        self._finish_trace(trace, result)
+        return result
+
+    def stream_response(self, query: str, history: Optional[List[dict]] = None) -> dict:
+        """Variante en streaming de generate_response. El contexto se arma antes de devolver;
+        result['stream'] es un generador de fragmentos y, al agotarse, deja el texto
+        completo en result['response'] y los tiempos por etapa en result['timings'].
+        result['close']() lo corta antes de tiempo."""
+        trace = tracing.start_trace("stream_response", streaming=True)
+        with tracing.use_trace(trace):
+            result = self._table_answer(query)
+            if result is not None:
+                context, retrieved, cacheable, cached = "", "", False, result["response"]
+            else:
+                result = self._build_context(query)
+                history_block, result["context_summary"] = self._build_history(history)
+                retrieved = result.pop("context")
+                context = history_block + retrieved
+                cacheable = self._answer_cacheable(query, history_block, result)
+                cached = self._cached_answer(query, retrieved, result) if cacheable else None
+        result["response"] = cached or ""
+
+        def stream():
+            # La traza se pasa explícitamente: el generador corre en el contexto de quien lo consume
+            try:
+                if cached is not None:
+                    yield cached
+                    return
+                parts = []
+                try:
+                    with trace.span("llm") as attrs:
+                        for text in self._generate_stream(query, context):
+                            if not parts:
+                                attrs["first_token_ms"] = round(trace.elapsed() * 1000, 3)
+                            parts.append(text)
+                            yield text
+                except Exception as e:
+                    result["response"] = f"Error: {e}"
+                    yield result["response"]
+                    return
+                result["response"] = "".join(parts)
+                with tracing.use_trace(trace):
+                    self._save_turn(query, result["response"])
+                    if cacheable:
+                        self._store_answer(query, retrieved, result["response"])
+            finally:
+                self._finish_trace(trace, result)
+
+        result["stream"] = stream()
+
+        def close():
+            """Cierra el stream aunque no se haya consumido entero (cliente desconectado): el
+            generador suelta la respuesta de Gemini y la traza se cierra igual, incluso si
+            nunca llegó a empezar."""
+            result["stream"].close()
+            self._finish_trace(trace, result)
+
+        result["close"] = close
+        return result
+
     def _needs_tools(self, query: str) -> bool:
         keywords = [
             "calcular", "operación", "hora", "fecha", "buscar", "web", "api",
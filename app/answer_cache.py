@@ -0,0 +1,122 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def context_fingerprint(context: str) -> str:
+    """Huella del contexto recuperado: dos preguntas parecidas sólo comparten respuesta si
+    el RAG les entregó exactamente el mismo material."""
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """Cache de respuestas del LLM indexada por embedding de la consulta + huella del contexto.
+
+    Los embeddings (normalizados) viven en una matriz preasignada de maxsize filas, así que
+    la búsqueda del vecino más cercano es un único producto matriz-vector acotado. Cada
+    entrada vence a los ttl segundos; al llenarse se reemplaza la de acceso más antiguo.
+    Si cambia la versión de la colección (re-indexado) se vacía entera.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 6 * 3600, threshold: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", 0.93)) if threshold is None else threshold
+        self._vectors: Optional[np.ndarray] = None  # se dimensiona con el primer embedding
+        self._entries: List[Optional[Dict]] = [None] * maxsize
+        self._last_access = np.zeros(maxsize, dtype=np.float64)
+        self._size = 0
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version: int):
+        if self._version != version:
+            self._clear()
+            self._version = version
+
+    def _clear(self):
+        self._entries = [None] * self.maxsize
+        self._last_access[:] = 0
+        self._size = 0
+
+    def get(self, embedding, fingerprint: str, version: int = 0) -> Optional[Dict]:
+        """Devuelve {'response', 'query', 'similarity'} de la entrada más parecida con la misma
+        huella de contexto, o None si ninguna supera el umbral."""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            if not self._size:
+                self.misses += 1
+                return None
+            scores = self._vectors[:self._size] @ query
+            best, best_score = None, self.threshold
+            for slot in np.argsort(-scores):
+                if scores[slot] < best_score:
+                    break
+                entry = self._entries[slot]
+                if entry is None or entry["fingerprint"] != fingerprint:
+                    continue
+                if entry["expires_at"] <= now:
+                    self._entries[slot] = None
+                    self._last_access[slot] = 0
+                    continue
+                best, best_score = int(slot), float(scores[slot])
+                break
+            if best is None:
+                self.misses += 1
+                return None
+            self._last_access[best] = now
+            self.hits += 1
+            entry = self._entries[best]
+            return {"response": entry["response"], "query": entry["query"], "similarity": best_score}
+
+    def set(self, embedding, fingerprint: str, query: str, response: str, version: int = 0):
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            if self._size < self.maxsize:
+                slot = self._size
+                self._size += 1
+            else:
+                # Primero un hueco (entrada vencida), si no la de acceso más antiguo
+                slot = int(np.argmin(self._last_access[:self._size]))
+                if self._entries[slot] is not None:
+                    self.evictions += 1
+            self._vectors[slot] = vector
+            self._entries[slot] = {"fingerprint": fingerprint, "query": query, "response": response,
+                                   "expires_at": now + self.ttl}
+            self._last_access[slot] = now
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def __len__(self) -> int:
+        return sum(1 for entry in self._entries[:self._size] if entry is not None)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
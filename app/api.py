@@ -0,0 +1,231 @@
+"""API HTTP del asistente, para frontends que no son Streamlit (puentes de WhatsApp/Instagram).
+
+Reutiliza los mismos recursos que la UI (RAG, Tools, modelo de Gemini) y el mismo registro
+de memorias por sesión. El trabajo bloqueante (encoder, Chroma, Gemini) corre en un pool de
+hilos acotado, así el event loop sólo atiende conexiones.
+
+    uvicorn api:app --app-dir app --host 0.0.0.0 --port 8000
+"""
+import os
+import json
+import uuid
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from memory import SessionRegistry
+from startup import BackgroundLoader, cargar_recursos
+
+os.makedirs("logs", exist_ok=True)
+logging.basicConfig(
+    filename="logs/api.log",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    encoding="utf-8"
+)
+
+API_WORKERS = int(os.getenv("API_WORKERS", 8))
+API_MAX_PENDING = int(os.getenv("API_MAX_PENDING", 64))  # pedidos en curso antes de responder 503
+WARMUP_TIMEOUT = float(os.getenv("API_WARMUP_TIMEOUT", 30.0))
+
+# Campos del resultado de Agent que se exponen al cliente
+RESULT_FIELDS = ("decision_path", "confidence_scores", "context_used", "tools_used", "cache_hit",
+                 "timings", "processing_time", "trace_id")
+
+
+class ChatRequest(BaseModel):
+    message: str = Field(..., min_length=1, max_length=4000)
+    session_id: Optional[str] = Field(None, max_length=128, description="Se genera uno nuevo si no viene")
+
+
+class ChatResponse(BaseModel):
+    session_id: str
+    response: str
+    decision_path: List[str] = []
+    confidence_scores: Dict[str, float] = {}
+    context_used: bool = False
+    tools_used: List[str] = []
+    cache_hit: bool = False
+    timings: Dict[str, float] = {}
+    processing_time: Optional[float] = None
+    trace_id: Optional[str] = None
+
+
+class ChatService:
+    """Estado compartido por todos los pedidos: precarga, memorias y pool de hilos."""
+
+    def __init__(self):
+        self.loader = BackgroundLoader(cargar_recursos)
+        self.sessions = SessionRegistry(session_file="./data/sessions.json")
+        self.executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api-worker")
+        self.pending = 0
+
+    async def run(self, fn, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def agent(self, session_id: str):
+        if not self.loader.ready():
+            # Se espera la precarga sin ocupar un hilo del pool; shield evita cancelarla al vencer
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.loader.future)), timeout=WARMUP_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="El asistente todavía se está iniciando",
+                                    headers={"Retry-After": "5"})
+            except Exception:
+                pass  # el error se informa abajo
+        if self.loader.error():
+            raise HTTPException(status_code=503, detail=f"Error al iniciar el asistente: {self.loader.error()}")
+        from agent import Agent
+
+        recursos = self.loader.get()
+        memory = self.sessions.get(session_id)
+        return Agent(rag_system=recursos["rag"], tools=recursos["tools"], memory=memory, model=recursos["model"])
+
+    def acquire(self):
+        """Limita los pedidos en curso: pasado API_MAX_PENDING se rechaza en vez de encolar sin fin.
+        Sólo se llama desde el event loop, así que el contador no necesita lock."""
+        if self.pending >= API_MAX_PENDING:
+            raise HTTPException(status_code=503, detail="Servidor ocupado, reintentá en unos segundos",
+                                headers={"Retry-After": "2"})
+        self.pending += 1
+
+    def release(self):
+        self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+service: Optional[ChatService] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global service
+    service = ChatService()  # la precarga arranca acá y corre mientras el servidor ya acepta conexiones
+    logging.info(f"🌐 API iniciada ({API_WORKERS} workers, hasta {API_MAX_PENDING} pedidos en curso)")
+    yield
+    service.shutdown()
+
+
+app = FastAPI(title="Asistente Virtual CEUT", lifespan=lifespan)
+
+
+def _result_fields(result: Dict) -> Dict:
+    return {k: result[k] for k in RESULT_FIELDS if k in result}
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest) -> ChatResponse:
+    session_id = request.session_id or uuid.uuid4().hex
+    service.acquire()
+    try:
+        agent = await service.agent(session_id)
+        result = await service.run(agent.generate_response, request.message)
+    finally:
+        service.release()
+    return ChatResponse(session_id=session_id, response=result["response"], **_result_fields(result))
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse que ejecuta on_close pase lo que pase: también cuando el cliente se
+    desconecta antes de que empiece el cuerpo y el generador de eventos nunca llega a correr."""
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """Server-Sent Events: 'meta' con el camino de recuperación, un 'token' por fragmento
+    y 'done' con la respuesta completa y los tiempos por etapa."""
+    session_id = request.session_id or uuid.uuid4().hex
+    service.acquire()
+    try:
+        agent = await service.agent(session_id)
+        result = await service.run(agent.stream_response, request.message)
+    except BaseException:
+        service.release()
+        raise
+
+    # El generador del agente se avanza y se cierra desde hilos del pool; el lock evita cerrarlo
+    # mientras otro hilo todavía espera un fragmento
+    stream_lock = threading.Lock()
+
+    def next_fragment() -> Optional[str]:
+        with stream_lock:
+            return next(result["stream"], None)
+
+    def close_stream():
+        with stream_lock:
+            result["close"]()  # corta la llamada a Gemini y cierra la traza
+
+    def on_close():
+        service.release()  # el pedido cuenta como en curso hasta que termina o se corta el stream
+        service.executor.submit(close_stream)
+
+    async def events() -> AsyncIterator[str]:
+        yield _sse("meta", {"session_id": session_id, **_result_fields(result)})
+        while True:
+            # Cada fragmento se pide en el pool: el generador bloquea esperando a Gemini
+            text = await service.run(next_fragment)
+            if text is None:
+                break
+            yield _sse("token", {"text": text})
+        yield _sse("done", {"session_id": session_id, "response": result["response"], **_result_fields(result)})
+
+    return ClosingStreamingResponse(events(), on_close, media_type="text/event-stream",
+                                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/health")
+async def health() -> Dict[str, str]:
+    """Liveness: el proceso responde, aunque los modelos todavía se estén cargando."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    """Readiness: 200 sólo cuando el encoder, Chroma y el índice ya están cargados."""
+    loader = service.loader
+    if not loader.ready():
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    if loader.error():
+        return JSONResponse(status_code=503, content={"status": "error", "detail": str(loader.error())})
+    recursos = loader.get()
+    rag = recursos["rag"]
+    stats = await service.run(rag.get_collection_stats)
+    return JSONResponse(content={
+        "status": "ready",
+        "warmup_seconds": round(loader.elapsed or 0.0, 3),
+        "documents": stats["total_documents"],
+        "collection_version": rag.collection_version,
+        "query_encoder": rag.query_encoder.stats() if rag.query_encoder else {},
+        "llm": recursos["model"].stats() if hasattr(recursos["model"], "stats") else {},
+        "sessions": len(service.sessions),
+        "pending_requests": service.pending,
+    })
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("API_HOST", "0.0.0.0"), port=int(os.getenv("API_PORT", 8000)))
@@ -0,0 +1,126 @@
+import os
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+
+
+class EmbeddingStore:
+    """Copia de los embeddings para visualización/analítica, fuera de la RAM.
+
+    Los vectores se guardan como filas contiguas (float16 por defecto) en un archivo binario
+    que se lee con np.memmap, y un índice JSON mapea id -> (fila, documento). No se guardan
+    textos: se piden a Chroma sólo para las filas que se van a mostrar. Un id re-escrito
+    reutiliza su fila; las filas de ids borrados se recuperan al compactar.
+    """
+
+    def __init__(self, directory: str, dtype: str = "float16"):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.bin")
+        self.index_path = os.path.join(directory, "index.json")
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self.rows = 0  # filas escritas en el archivo (incluye las huérfanas)
+        self.index: Dict[str, Tuple[int, str]] = {}  # id -> (fila, document_name)
+        self._lock = threading.RLock()
+        if os.path.exists(self.index_path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def add(self, ids: Iterable[str], embeddings, documents: Iterable[str]):
+        """Escribe (o reemplaza) los vectores de ids, agrupados por nombre de documento."""
+        embeddings = np.asarray(embeddings, dtype=self.dtype)
+        if embeddings.ndim != 2 or not len(embeddings):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            os.makedirs(self.directory, exist_ok=True)
+            row_bytes = self.dim * self.dtype.itemsize
+            with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "w+b") as f:
+                for doc_id, vector, document in zip(ids, embeddings, documents):
+                    row = self.index[doc_id][0] if doc_id in self.index else self.rows
+                    if row == self.rows:
+                        self.rows += 1
+                    f.seek(row * row_bytes)
+                    f.write(vector.tobytes())
+                    self.index[doc_id] = (row, document)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self.index.pop(doc_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.index.clear()
+            self.rows = 0
+            self.dim = None
+            if os.path.exists(self.vectors_path):
+                os.remove(self.vectors_path)
+
+    def documents(self) -> List[str]:
+        with self._lock:
+            return sorted({document for _, document in self.index.values()})
+
+    def load_vectors(self, document_name: Optional[str] = None) -> Tuple[List[str], List[str], np.ndarray]:
+        """(ids, documentos, vectores float32) de un documento, o de todos si es None.
+        Sólo las filas pedidas se copian a memoria; el resto del archivo no se toca."""
+        with self._lock:
+            selected = sorted(
+                ((row, doc_id, document) for doc_id, (row, document) in self.index.items()
+                 if document_name is None or document == document_name)
+            )
+            if not selected or self.dim is None:
+                return [], [], np.zeros((0, self.dim or 0), dtype=np.float32)
+            matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self.rows, self.dim))
+            vectors = np.asarray(matrix[[row for row, _, _ in selected]], dtype=np.float32)
+            del matrix
+        return [doc_id for _, doc_id, _ in selected], [document for _, _, document in selected], vectors
+
+    def compact(self):
+        """Reescribe el archivo sin las filas de ids borrados."""
+        with self._lock:
+            if self.dim is None or self.rows == len(self.index):
+                return
+            ordered = sorted(self.index.items(), key=lambda kv: kv[1][0])
+            tmp_path = f"{self.vectors_path}.tmp"
+            if ordered:
+                matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self.rows, self.dim))
+                with open(tmp_path, "wb") as f:
+                    for start in range(0, len(ordered), 4096):
+                        chunk = ordered[start:start + 4096]
+                        f.write(np.ascontiguousarray(matrix[[row for _, (row, _) in chunk]]).tobytes())
+                del matrix
+                os.replace(tmp_path, self.vectors_path)
+            elif os.path.exists(self.vectors_path):
+                os.remove(self.vectors_path)
+            self.index = {doc_id: (new_row, document) for new_row, (doc_id, (_, document)) in enumerate(ordered)}
+            self.rows = len(ordered)
+
+    def save(self):
+        with self._lock:
+            if self.rows > 2 * len(self.index) + 1024:
+                self.compact()
+            payload = json.dumps({"version": STORE_FORMAT_VERSION, "dtype": self.dtype.name, "dim": self.dim,
+                                  "rows": self.rows, "index": self.index}, ensure_ascii=False)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.index_path)
+
+    def load(self):
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != STORE_FORMAT_VERSION or data.get("dtype") != self.dtype.name:
+            return  # formato distinto: queda vacío y RAG lo reconstruye desde Chroma
+        with self._lock:
+            self.dim = data["dim"]
+            self.rows = data["rows"]
+            self.index = {doc_id: (row, document) for doc_id, (row, document) in data["index"].items()}
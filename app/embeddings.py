@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+HF_EMBEDDING_MODEL = f"sentence-transformers/{EMBEDDING_MODEL}"
+MAX_SEQ_LENGTH = 128  # el mismo límite que usa sentence-transformers para este modelo
+
+PARITY_SENTENCES = [
+    "¿Cuáles son las correlativas de Análisis Matemático II?",
+    "Materias de primer año de Ingeniería en Sistemas de Información",
+    "¿Qué becas están disponibles para estudiantes de la UTN Santa Fe?",
+    "Teléfonos útiles de la facultad",
+    "Plan de estudio de Ingeniería Civil, carga horaria total",
+]
+
+
+class SentenceTransformerBackend:
+    """Backend de referencia: el modelo completo en PyTorch fp32."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, num_threads: Optional[int] = None):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, **kwargs)
+
+
+class OnnxEmbeddingBackend:
+    """El mismo modelo exportado a ONNX y cuantizado a int8 (pesos), ejecutado con ONNX Runtime.
+
+    Replica el pipeline de sentence-transformers (tokenizador, truncado a 128 tokens y mean
+    pooling sin normalizar), así que sus vectores son intercambiables con los ya indexados.
+    La exportación y la cuantización se hacen una sola vez y quedan en cache_dir.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name: str = HF_EMBEDDING_MODEL, cache_dir: str = "./data/onnx",
+                 num_threads: Optional[int] = None, quantize: bool = True):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model_path = self._ensure_model(quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _ensure_model(self, quantize: bool) -> str:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fp32_path = os.path.join(self.cache_dir, "model.onnx")
+        int8_path = os.path.join(self.cache_dir, "model.int8.onnx")
+        if not os.path.exists(fp32_path):
+            self._export(fp32_path)
+        if not quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+            logging.info(f"🧮 Modelo de embeddings cuantizado a int8: {int8_path}")
+        return int8_path
+
+    def _export(self, path: str):
+        import torch
+        from transformers import AutoModel
+
+        model = AutoModel.from_pretrained(self.model_name).eval()
+        sample = self.tokenizer(["exportación"], return_tensors="pt")
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"]),
+                path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"},
+                },
+                opset_version=14,
+            )
+        logging.info(f"🧮 Modelo de embeddings exportado a ONNX: {path}")
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            encoded = self.tokenizer(batch, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np")
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            outputs.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        if not outputs:
+            return np.zeros((0, 384), dtype=np.float32)
+        return np.vstack(outputs).astype(np.float32)
+
+
+class BatchingEncoder:
+    """Agrupa las consultas concurrentes en una sola pasada del encoder.
+
+    Cada encode_one() encola su texto y espera un Future. Un hilo único toma lo acumulado
+    hasta max_batch textos o max_wait segundos desde la primera consulta en espera, lo
+    codifica en un solo batch y reparte los vectores. Mientras corre un batch, las consultas
+    nuevas ya se van juntando para el siguiente.
+    """
+
+    def __init__(self, backend, max_batch: Optional[int] = None, max_wait: Optional[float] = None):
+        self.backend = backend
+        self.max_batch = max_batch or int(os.getenv("RAG_ENCODE_MAX_BATCH", 32))
+        self.max_wait = float(os.getenv("RAG_ENCODE_MAX_WAIT_MS", 5)) / 1000 if max_wait is None else max_wait
+        self._queue: List[Tuple[str, Future, float]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        # Métricas
+        self.requests = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.batch_sizes: Counter = Counter()
+        self.total_wait = 0.0
+        self.total_encode = 0.0
+        self._worker = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+        self._worker.start()
+
+    def encode_one(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchingEncoder cerrado")
+            self._queue.append((text, future, time.perf_counter()))
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            self._cond.notify()
+        return future.result(timeout=timeout)
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Codificación masiva (indexado): va directo al backend, sin pasar por la cola."""
+        return self.backend.encode(texts, batch_size=batch_size, **kwargs)
+
+    def _next_batch(self) -> List[Tuple[str, Future, float]]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if self._closed and not self._queue:
+                return []
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            start = time.perf_counter()
+            try:
+                vectors = self.backend.encode([text for text, _, _ in batch], batch_size=len(batch))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            end = time.perf_counter()
+            for (_, future, queued_at), vector in zip(batch, vectors):
+                future.set_result(vector)
+            with self._cond:
+                self.batches += 1
+                self.batch_sizes[len(batch)] += 1
+                self.total_wait += sum(start - queued_at for _, _, queued_at in batch)
+                self.total_encode += end - start
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout=1.0)
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            served = sum(size * count for size, count in self.batch_sizes.items())
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "mean_batch_size": served / self.batches if self.batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "mean_queue_wait_ms": self.total_wait / served * 1000 if served else 0.0,
+                "mean_batch_encode_ms": self.total_encode / self.batches * 1000 if self.batches else 0.0,
+            }
+
+
+def check_parity(reference, candidate, texts: Optional[List[str]] = None, threshold: float = 0.99) -> Dict[str, float]:
+    """Compara los embeddings de dos backends con similitud coseno por oración."""
+    texts = texts or PARITY_SENTENCES
+    a = np.asarray(reference.encode(texts), dtype=np.float32)
+    b = np.asarray(candidate.encode(texts), dtype=np.float32)
+    cos = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean()), "ok": bool(cos.min() >= threshold)}
+
+
+def _onnx_parity(backend: OnnxEmbeddingBackend, num_threads: Optional[int] = None) -> Dict[str, float]:
+    """check_parity contra PyTorch, una sola vez por modelo exportado: el resultado queda
+    junto al .onnx (p. ej. model.int8.onnx.parity.json) asociado a su tamaño y mtime, así
+    un modelo re-exportado o re-cuantizado se vuelve a validar."""
+    stat = os.stat(backend.model_path)
+    model_id = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    cache_path = f"{backend.model_path}.parity.json"
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("model") == model_id:
+            return cached["parity"]
+    except (OSError, ValueError, KeyError):
+        pass
+    parity = check_parity(SentenceTransformerBackend(num_threads=num_threads), backend)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"model": model_id, "parity": parity}, f)
+    os.replace(tmp_path, cache_path)
+    return parity
+
+
+def create_embedding_backend(mode: Optional[str] = None, num_threads: Optional[int] = None):
+    """Crea el backend según EMBEDDING_BACKEND ('torch' por defecto, u 'onnx').
+
+    El backend ONNX siempre se valida contra PyTorch, que es con el que se construyó el
+    índice (el resultado se cachea por modelo exportado); si no alcanza el umbral se vuelve
+    a PyTorch para no mezclar vectores incompatibles.
+    """
+    mode = (mode or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    num_threads = num_threads or (int(os.getenv("EMBEDDING_THREADS")) if os.getenv("EMBEDDING_THREADS") else None)
+    if mode != "onnx":
+        return SentenceTransformerBackend(num_threads=num_threads)
+    try:
+        backend = OnnxEmbeddingBackend(num_threads=num_threads)
+    except Exception as e:
+        logging.error(f"❌ No se pudo crear el backend ONNX ({e}), se usa PyTorch")
+        return SentenceTransformerBackend(num_threads=num_threads)
+    parity = _onnx_parity(backend, num_threads=num_threads)
+    logging.info(f"🧮 Paridad ONNX vs PyTorch: {parity}")
+    if not parity["ok"]:
+        logging.warning("⚠️ El backend ONNX no pasó el chequeo de paridad, se usa PyTorch")
+        return SentenceTransformerBackend(num_threads=num_threads)
+    return backend
@@ -0,0 +1,223 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from tools import Tools, Chunk
+
+MANIFEST_VERSION = 3  # v2: colección con distancia coseno; v3: carrera por archivo y banderas por año
+MANIFEST_FILENAME = "index_manifest.json"
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, chunk: Chunk, occurrence: int = 0) -> str:
+    """Id estable derivado del contenido: no depende de la posición del chunk en el corpus."""
+    key = f"{source}\x00{chunk.chunk_type}\x00{chunk.content}\x00{occurrence}"
+    return f"{os.path.splitext(source)[0][:40]}_{hash_text(key)[:20]}"
+
+
+class IncrementalIndexer:
+    """Sincroniza la carpeta de PDFs con la colección de Chroma usando un manifiesto de hashes.
+
+    El manifiesto guarda, por archivo, el hash del PDF, el hash de cada página y los ids
+    de sus chunks. Sólo se re-procesan los PDFs cuyo contenido cambió, sólo se embeben los
+    chunks nuevos y se eliminan los chunks cuyo origen desapareció. Las tablas de cada PDF
+    re-procesado se guardan además como filas en el TableStore del RAG, si lo tiene.
+    """
+
+    def __init__(self, rag, tools: Optional[Tools] = None, manifest_path: Optional[str] = None):
+        self.rag = rag
+        self.tools = tools or rag.tools
+        self.manifest_path = manifest_path or os.path.join(rag.persist_directory, MANIFEST_FILENAME)
+        self.table_store = getattr(rag, "table_store", None)
+        self.manifest = self.load_manifest()
+
+    # --- Manifiesto ---
+    def load_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    return data
+                logging.warning("⚠️ Versión de manifiesto distinta, se reconstruye el índice.")
+            except Exception as e:
+                logging.warning(f"⚠️ Manifiesto ilegible ({e}), se reconstruye el índice.")
+        return {"version": MANIFEST_VERSION, "files": {}}
+
+    def save_manifest(self):
+        """Escritura atómica: nunca deja un manifiesto a medio escribir."""
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _manifest_chunk_count(self) -> int:
+        return sum(len(entry.get("chunks", [])) for entry in self.manifest["files"].values())
+
+    # --- Sincronización ---
+    def sync(self, folder_path: str = "data") -> Dict[str, int]:
+        stats = {"unchanged": 0, "updated": 0, "removed": 0, "added_chunks": 0, "deleted_chunks": 0}
+        self._check_consistency()
+
+        pdfs = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".pdf")) if os.path.isdir(folder_path) else []
+        files = self.manifest["files"]
+
+        # PDFs que ya no existen: borrar sus chunks
+        for name in [n for n in files if n not in pdfs]:
+            old_ids = files.pop(name).get("chunks", [])
+            self.rag.delete_chunks(old_ids)
+            if self.table_store is not None:
+                self.table_store.remove_source(name)
+            stats["removed"] += 1
+            stats["deleted_chunks"] += len(old_ids)
+            logging.info(f"🗑️ PDF eliminado del índice: {name} ({len(old_ids)} chunks)")
+            self.save_manifest()
+
+        changed = []
+        for name in pdfs:
+            path = os.path.join(folder_path, name)
+            entry = files.get(name)
+            file_stat = os.stat(path)
+            # Atajo barato: mismo tamaño y mtime => no hace falta ni hashear el archivo
+            if entry and entry.get("size") == file_stat.st_size and entry.get("mtime_ns") == file_stat.st_mtime_ns:
+                stats["unchanged"] += 1
+                continue
+            file_hash = hash_file(path)
+            if entry and entry.get("file_hash") == file_hash:
+                entry["size"], entry["mtime_ns"] = file_stat.st_size, file_stat.st_mtime_ns
+                stats["unchanged"] += 1
+                self.save_manifest()
+                continue
+            changed.append((name, path, file_hash, file_stat))
+
+        if changed:
+            # Todos los PDFs modificados se procesan juntos para aprovechar el pool de procesos
+            chunks = self.tools.pdf_processor.process_files([path for _, path, _, _ in changed])
+            by_source: Dict[str, List[Chunk]] = {}
+            for c in chunks:
+                by_source.setdefault(c.source, []).append(c)
+
+            for name, path, file_hash, file_stat in changed:
+                if path not in by_source:
+                    logging.warning(f"⚠️ {name} no produjo chunks, se conserva la versión indexada anterior.")
+                    continue
+                try:
+                    added, deleted = self._sync_file(name, by_source[path], file_hash, file_stat)
+                except Exception as e:
+                    logging.error(f"❌ Error indexando {name}: {e}")
+                    continue
+                stats["updated"] += 1
+                stats["added_chunks"] += added
+                stats["deleted_chunks"] += deleted
+                self.save_manifest()
+                self._sync_tables(name, file_hash, by_source[path])
+
+        self._backfill_tables(folder_path, pdfs)
+        logging.info(f"📚 Sincronización del índice: {stats}")
+        return stats
+
+    def _sync_tables(self, name: str, file_hash: str, chunks: List[Chunk]):
+        if self.table_store is None:
+            return
+        try:
+            rows = self.table_store.replace_source(name, file_hash, chunks)
+            logging.info(f"📋 {name}: {rows} materias en el índice de tablas")
+        except Exception as e:
+            logging.error(f"❌ Error guardando las tablas de {name}: {e}")
+
+    def _backfill_tables(self, folder_path: str, pdfs: List[str]):
+        """PDFs indexados cuyas tablas no están en el TableStore (primera vez, o un error
+        anterior): se re-extraen sólo para las tablas, sin tocar Chroma."""
+        if self.table_store is None:
+            return
+        files = self.manifest["files"]
+        stale = [name for name in pdfs if name in files and self.table_store.file_hash(name) != files[name]["file_hash"]]
+        if not stale:
+            return
+        paths = {os.path.join(folder_path, name): name for name in stale}
+        by_source: Dict[str, List[Chunk]] = {}
+        for c in self.tools.pdf_processor.process_files(list(paths)):
+            by_source.setdefault(c.source, []).append(c)
+        for path, name in paths.items():
+            if path in by_source:
+                self._sync_tables(name, files[name]["file_hash"], by_source[path])
+
+    def _check_consistency(self):
+        """Si la colección no coincide con el manifiesto (base borrada, ids posicionales viejos), se reindexa todo."""
+        total = self.rag.get_collection_stats()["total_documents"]
+        expected = self._manifest_chunk_count()
+        if total == expected:
+            return
+        logging.warning(f"⚠️ Colección ({total}) y manifiesto ({expected}) no coinciden. Reindexación completa.")
+        if total:
+            self.rag.clear_collection()
+        self.manifest = {"version": MANIFEST_VERSION, "files": {}}
+        self.save_manifest()
+
+    def _build_chunks(self, name: str, chunks: List[Chunk]) -> Tuple[List[str], Dict[str, Dict]]:
+        ids, pages, seen = [], {}, {}
+        for c in chunks:
+            base = (c.chunk_type, c.content)
+            occurrence = seen.get(base, 0)
+            seen[base] = occurrence + 1
+            cid = chunk_id(name, c, occurrence)
+            c.metadata.update({"source": name, "page": c.page, "chunk_type": c.chunk_type})
+            ids.append(cid)
+            page = pages.setdefault(str(c.page), {"hash": hashlib.sha1(), "chunks": []})
+            page["hash"].update(c.content.encode("utf-8"))
+            page["chunks"].append(cid)
+        for page in pages.values():
+            page["hash"] = page["hash"].hexdigest()
+        return ids, pages
+
+    def _sync_file(self, name: str, chunks: List[Chunk], file_hash: str, file_stat: os.stat_result) -> Tuple[int, int]:
+        entry = self.manifest["files"].get(name, {})
+        ids, pages = self._build_chunks(name, chunks)
+
+        old_pages = entry.get("pages", {})
+        changed_pages = [p for p, info in pages.items() if old_pages.get(p, {}).get("hash") != info["hash"]]
+        logging.info(f"🔄 {name}: {len(changed_pages)} de {len(pages)} páginas cambiaron")
+
+        old_ids = set(entry.get("chunks", []))
+        new_ids = set(ids)
+        to_add = [i for i, cid in enumerate(ids) if cid not in old_ids]
+        to_delete = list(old_ids - new_ids)
+        to_keep = [i for i, cid in enumerate(ids) if cid in old_ids]
+
+        if to_delete:
+            self.rag.delete_chunks(to_delete)
+        if to_keep:
+            # Los chunks sin cambios no se re-embeben, sólo se actualiza su metadata (p. ej. número de página)
+            self.rag.update_chunk_metadata([ids[i] for i in to_keep], [chunks[i].metadata for i in to_keep])
+        if to_add:
+            ok = self.rag.upsert_chunks(
+                [ids[i] for i in to_add],
+                [chunks[i].content for i in to_add],
+                [chunks[i].metadata for i in to_add],
+            )
+            if not ok:
+                raise RuntimeError(f"No se pudieron indexar los chunks de {name}")
+
+        self.manifest["files"][name] = {
+            "file_hash": file_hash,
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "pages": pages,
+            "chunks": ids,
+        }
+        logging.info(f"✅ {name}: +{len(to_add)} / -{len(to_delete)} chunks ({len(to_keep)} reutilizados)")
+        return len(to_add), len(to_delete)
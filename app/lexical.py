@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+STOPWORDS = {
+    'de', 'la', 'el', 'los', 'las', 'del', 'y', 'o', 'en', 'a', 'al', 'un', 'una', 'unos', 'unas',
+    'que', 'por', 'para', 'con', 'sin', 'se', 'es', 'son', 'su', 'sus', 'lo', 'le', 'les', 'como',
+    'mas', 'pero', 'si', 'no', 'hay', 'cual', 'cuales', 'que', 'esta', 'este', 'estan', 'me', 'mi',
+}
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Metadata que se guarda por documento para poder filtrar igual que en Chroma
+FILTER_KEYS = ('carrera', 'tipo_contenido')
+YEAR_KEY_PREFIX = 'año_'  # una bandera por año: un chunk puede abarcar dos niveles
+INDEX_FORMAT_VERSION = 4
+
+
+def year_key(año: int) -> str:
+    return f"{YEAR_KEY_PREFIX}{año}"
+
+
+def filter_metadata(meta: Dict) -> Dict:
+    return {k: v for k, v in meta.items() if k in FILTER_KEYS or k.startswith(YEAR_KEY_PREFIX)}
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin tildes y sin stopwords. Los números y códigos se conservan enteros."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return [t for t in TOKEN_PATTERN.findall(text) if t not in STOPWORDS and (len(t) > 1 or t.isdigit())]
+
+
+# Ordinales y numerales sueltos ("1", "2do", "1er", "3ro"): aparecen en casi todos los planes
+ORDINAL_PATTERN = re.compile(r'^\d{1,2}(o|a|ro|ra|er|do|da|to|ta|vo|va|mo|ma|no|na)?$')
+
+
+def exact_terms(query: str) -> List[str]:
+    """Términos que sólo tienen sentido como coincidencia exacta: números de teléfono,
+    ordenanzas, años (3 o más dígitos) y códigos alfanuméricos. Los ordinales y los
+    números de una o dos cifras no cuentan: "1 año" o "Física 2" no son códigos."""
+    terms = []
+    for t in tokenize(query):
+        digits = sum(ch.isdigit() for ch in t)
+        if not digits or ORDINAL_PATTERN.match(t):
+            continue
+        if digits >= 3 or digits < len(t):
+            terms.append(t)
+    return terms
+
+
+class BM25Index:
+    """Índice invertido BM25 en memoria sobre los mismos chunks que están en Chroma.
+
+    Se actualiza en forma incremental (add/remove por id) y se persiste en JSON junto a la
+    base vectorial; las listas de postings se reconstruyen al cargar.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict] = {}  # id -> {"source", "meta", "tf"}; el texto vive sólo en Chroma
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, ids: Iterable[str], texts: Iterable[str], metadatas: Iterable[Dict]):
+        with self._lock:
+            for doc_id, text, meta in zip(ids, texts, metadatas):
+                self._remove_one(doc_id)
+                tf = Counter(tokenize(text))
+                meta = meta or {}
+                self._insert(doc_id, {
+                    "source": meta.get("source", "local"),
+                    "meta": filter_metadata(meta),
+                    "tf": dict(tf)
+                })
+
+    def _insert(self, doc_id: str, doc: Dict):
+        self.docs[doc_id] = doc
+        self.doc_lengths[doc_id] = sum(doc["tf"].values())
+        self.total_length += self.doc_lengths[doc_id]
+        for term, freq in doc["tf"].items():
+            self.postings[term][doc_id] = freq
+
+    def _remove_one(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        for term in doc["tf"]:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove_one(doc_id)
+
+    def update_sources(self, ids: Iterable[str], metadatas: Iterable[Dict]):
+        with self._lock:
+            for doc_id, meta in zip(ids, metadatas):
+                if doc_id in self.docs:
+                    meta = meta or {}
+                    self.docs[doc_id]["source"] = meta.get("source", "local")
+                    self.docs[doc_id]["meta"] = filter_metadata(meta)
+
+    def clear(self):
+        with self._lock:
+            self.docs.clear()
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.total_length = 0
+
+    def _matches(self, doc_id: str, filters: Optional[Dict]) -> bool:
+        if not filters:
+            return True
+        meta = self.docs[doc_id].get("meta", {})
+        return all(meta.get(year_key(v)) is True if k == 'año' else meta.get(k) == v for k, v in filters.items())
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        terms = tokenize(query)
+        with self._lock:
+            n = len(self.docs)
+            if not n or not terms:
+                return []
+            avg_len = self.total_length / n
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(terms):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, freq in posting.items():
+                    if filters and not self._matches(doc_id, filters):
+                        continue
+                    norm = freq + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_len)
+                    scores[doc_id] += idf * freq * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+
+    def contains_all(self, doc_id: str, terms: List[str]) -> bool:
+        tf = self.docs.get(doc_id, {}).get("tf", {})
+        return all(t in tf for t in terms)
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        return self.docs.get(doc_id)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            payload = json.dumps({"version": INDEX_FORMAT_VERSION, "k1": self.k1, "b": self.b, "docs": self.docs}, ensure_ascii=False)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            return  # formato viejo: queda vacío y RAG lo reconstruye desde Chroma
+        with self._lock:
+            self.clear()
+            for doc_id, doc in data.get("docs", {}).items():
+                self._insert(doc_id, doc)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
@@ -5,9 +5,7 @@ if sys.platform.startswith("win") and sys.version_info >= (3, 8):
 
 import streamlit as st
 import base64
-from rag import RAG
-from tools import Tools
-import os
+import uuid
 
 import nest_asyncio
 nest_asyncio.apply()
@@ -35,9 +33,9 @@ def get_base64_image(image_path):
     except:
         return None
 
-from agent import Agent
-
-from memory import ConversationMemory  # IMPORTA tu clase memory
+# rag/agent (torch, chromadb, langchain, gemini) se importan recién en el hilo de precarga
+from memory import SessionRegistry  # IMPORTA tu clase memory
+from startup import BackgroundLoader, cargar_recursos
 
 import logging
 
@@ -49,42 +47,27 @@ logging.basicConfig(
 )
 
 @st.cache_resource
-def cargar_chat_engine():
-    logging.info("📦 Iniciando carga del motor de chat...")
-    tools = Tools(tavily_api_key=os.getenv("TAVILY_API_KEY"))
-    logging.info(f"🔧 Tools instanciado correctamente: {type(tools)}")
-    
-    # Paso 1: Cargar e indexar documentos si es necesario
-    persist_path = "./data/chroma_db"
-    needs_indexing = True
-
-    rag = RAG(persist_directory=persist_path, tools=tools)
-    
-    stats = rag.get_collection_stats()
-    logging.info(f"📊 DOCUMENTOS EN BASE: {stats['total_documents']}")
-    
-    if needs_indexing:
-        logging.info("📂 No hay base persistente o está vacía. Se cargarán documentos desde carpeta 'data/'.")
-        documents = tools.load_pdfs_from_folder("data")
-        for doc in documents:
-            logging.info(f"📝 Documento: {doc.metadata.get('source', 'desconocido')}")
-        
-        success = rag.index_documents(documents, document_name="ceut")
-        stats = rag.get_collection_stats()
-        
-        if success:
-            logging.info(f"✅ Indexación exitosa. Total documentos indexados: {stats['total_documents']}")
-        else:
-            logging.warning("⚠️ Falló la indexación de documentos.")
-    else:
-        stats = rag.get_collection_stats()
-        logging.info(f"📚 Sistema RAG inicializado. Documentos ya indexados: {stats['total_documents']}")
+def iniciar_precarga():
+    """Arranca una sola vez por proceso la carga de los recursos pesados en segundo plano."""
+    return BackgroundLoader(cargar_recursos)
+
 
-    # Paso 3: Inicializar memoria y agente
-    memory = ConversationMemory(session_file="./data/sessions.json", user_id="default_user")
-    logging.info("🧠 Memoria de conversación inicializada.")
+@st.cache_resource
+def cargar_sesiones():
+    """Registro de memorias por sesión: es liviano, no espera a la precarga."""
+    logging.info("🧠 Registro de memorias por sesión inicializado.")
+    return SessionRegistry(session_file="./data/sessions.json")
+
+
+def cargar_chat_engine():
+    """Agente liviano de la sesión actual: comparte los recursos pesados pero tiene su propia memoria."""
+    from agent import Agent
 
-    return Agent(rag_system=rag, tools=tools, memory=memory)
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    recursos = iniciar_precarga().get()  # bloquea sólo si la precarga todavía no terminó
+    memory = cargar_sesiones().get(st.session_state.session_id)
+    return Agent(rag_system=recursos["rag"], tools=recursos["tools"], memory=memory, model=recursos["model"])
 
 
 def render_header():
@@ -136,28 +119,36 @@ def render_contact_info():
     </div>
     """, unsafe_allow_html=True)
 
+def user_message_html(entrada):
+    return f"""
+    <div class="message-container user-message">
+        <div class="message-content user">
+            <div class="avatar user-avatar">👤</div>
+            <div class="message-text">{entrada}</div>
+        </div>
+    </div>
+    """
+
+def bot_message_html(salida):
+    return f"""
+    <div class="message-container bot-message">
+        <div class="message-content bot">
+            <div class="avatar bot-avatar">🤖</div>
+            <div class="message-text">{salida}</div>
+        </div>
+    </div>
+    """
+
 def render_chat_messages():
     if st.session_state.historial:
         for entrada, salida in st.session_state.historial:
             if entrada.strip():
-                st.markdown(f"""
-                <div class="message-container user-message">
-                    <div class="message-content user">
-                        <div class="avatar user-avatar">👤</div>
-                        <div class="message-text">{entrada}</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            st.markdown(f"""
-            <div class="message-container bot-message">
-                <div class="message-content bot">
-                    <div class="avatar bot-avatar">🤖</div>
-                    <div class="message-text">{salida}</div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+                st.markdown(user_message_html(entrada), unsafe_allow_html=True)
+            st.markdown(bot_message_html(salida), unsafe_allow_html=True)
 
 def limpiar_historial():
+    if "session_id" in st.session_state:
+        cargar_sesiones().get(st.session_state.session_id).clear_history()
     st.session_state.historial = [("", "¡Hola! 👋 Soy el asistente virtual del Centro de Estudiantes UTN FRSF. Estoy aquí para ayudarte.")]
 
 def main():
@@ -170,7 +161,7 @@ def main():
     if "send_message" not in st.session_state:
         st.session_state.send_message = False
 
-    agent = cargar_chat_engine()  # 🟢 Renombrado por claridad
+    precarga = iniciar_precarga()  # 🟢 Los modelos cargan en segundo plano mientras se dibuja la UI
     render_header()
 
     col1, col2 = st.columns([3, 1])
@@ -182,8 +173,12 @@ def main():
             <span class="powered-badge">Powered by Groq</span>
         </div>
         """, unsafe_allow_html=True)
+        if not precarga.ready():
+            st.caption("⏳ Preparando el asistente en segundo plano...")
 
         render_chat_messages()
+        # Acá se dibuja la respuesta en curso mientras llegan los tokens
+        stream_placeholder = st.empty()
         st.markdown('</div>', unsafe_allow_html=True)
 
         st.markdown('<div class="input-container">', unsafe_allow_html=True)
@@ -214,25 +209,34 @@ def main():
             st.session_state.send_message = False
             st.session_state.input_usuario = ""
 
-        with st.spinner("🤖 Pensando..."):
-            try:
-                resultado = agent.generate_response(input_usuario)  # 🟢 Llamamos a agent, no rag
-                respuesta = resultado['response']
-
-                # 🟢 Podés mostrar qué sistemas se usaron, si querés:
-                sistemas = []
-                if resultado.get("context_used"):
-                    sistemas.append("📄 RAG")
-                if resultado.get("tools_used"):
-                    sistemas.append("🛠️ Tools")
-
-                if sistemas:
-                    respuesta += f"\n\n_Respuesta generada usando: {' + '.join(sistemas)}_"
-
-                st.session_state.historial.append((input_usuario, respuesta))
-                st.rerun()
-            except Exception as e:
-                st.error(f"⚠️ Ocurrió un error: {e}")
+        try:
+            with st.spinner("🤖 Pensando..."):
+                agent = cargar_chat_engine()
+                resultado = agent.stream_response(input_usuario)  # 🟢 Llamamos a agent, no rag
+
+            # 🟢 Se muestra la respuesta a medida que Gemini la genera
+            respuesta = ""
+            for fragmento in resultado["stream"]:
+                respuesta += fragmento
+                stream_placeholder.markdown(
+                    user_message_html(input_usuario) + bot_message_html(respuesta + "▌"),
+                    unsafe_allow_html=True
+                )
+
+            # 🟢 Podés mostrar qué sistemas se usaron, si querés:
+            sistemas = []
+            if resultado.get("context_used"):
+                sistemas.append("📄 RAG")
+            if resultado.get("tools_used"):
+                sistemas.append("🛠️ Tools")
+
+            if sistemas:
+                respuesta += f"\n\n_Respuesta generada usando: {' + '.join(sistemas)}_"
+
+            st.session_state.historial.append((input_usuario, respuesta))
+            st.rerun()
+        except Exception as e:
+            st.error(f"⚠️ Ocurrió un error: {e}")
 
 if __name__ == "__main__":
     main()
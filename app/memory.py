@@ -1,34 +1,194 @@
 import json
 import os
-from typing import List, Dict, Optional
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Dict, Optional, Tuple
+
+
+class SessionStore:
+    """Historial de conversaciones en SQLite con WAL.
+
+    Cada mensaje es un INSERT (O(1)) en vez de reescribir el JSON de todos los usuarios;
+    las filas están particionadas por user_id con un índice, así que cargar un historial
+    sólo lee las filas de ese usuario. Cada escritura es una transacción atómica y WAL
+    permite lectores concurrentes mientras otra sesión escribe.
+    """
+
+    def __init__(self, db_path: str, legacy_json: Optional[str] = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id, id)")
+        # Resumen incremental de la conversación: cubre todos los mensajes con id <= covered_until
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                user_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                covered_until INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        if legacy_json:
+            self._import_legacy_json(legacy_json)
+
+    def _import_legacy_json(self, path: str):
+        """Migra una única vez el sessions.json anterior (sólo si la base está vacía)."""
+        if not os.path.exists(path):
+            return
+        if self._conn.execute("SELECT 1 FROM messages LIMIT 1").fetchone():
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                sessions = json.load(f)
+        except Exception:
+            return
+        now = time.time()
+        rows = [(user_id, m["role"], m["content"], now) for user_id, msgs in sessions.items() for m in msgs]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)", rows)
+
+    def append(self, user_id: str, role: str, content: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, role, content, time.time())
+            )
+
+    def load(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        with self._lock:
+            if limit is None:
+                rows = self._conn.execute(
+                    "SELECT role, content FROM messages WHERE user_id = ? ORDER BY id", (user_id,)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT role, content FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+                ).fetchall()[::-1]
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def load_with_ids(self, user_id: str, after_id: int = 0, before_id: Optional[int] = None,
+                      limit: Optional[int] = None) -> List[Dict]:
+        """Mensajes con id en (after_id, before_id), en orden; con limit, los últimos `limit`."""
+        query = "SELECT id, role, content FROM messages WHERE user_id = ? AND id > ?"
+        params: list = [user_id, after_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()[::-1]
+        return [{"id": row_id, "role": role, "content": content} for row_id, role, content in rows]
+
+    def get_summary(self, user_id: str) -> Tuple[str, int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, covered_until FROM summaries WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+
+    def set_summary(self, user_id: str, summary: str, covered_until: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (user_id, summary, covered_until, updated_at) VALUES (?, ?, ?, ?)",
+                (user_id, summary, covered_until, time.time())
+            )
+
+    def clear(self, user_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM summaries WHERE user_id = ?", (user_id,))
+
+    def export(self) -> Dict[str, List[Dict[str, str]]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, role, content FROM messages ORDER BY id").fetchall()
+        sessions: Dict[str, List[Dict[str, str]]] = {}
+        for user_id, role, content in rows:
+            sessions.setdefault(user_id, []).append({"role": role, "content": content})
+        return sessions
+
+
+_stores: Dict[str, SessionStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_session_store(db_path: str, legacy_json: Optional[str] = None) -> SessionStore:
+    """Una sola conexión por archivo y por proceso, compartida entre sesiones."""
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = SessionStore(db_path, legacy_json=legacy_json)
+        return _stores[db_path]
+
 
 class ConversationMemory:
-    def __init__(self, session_file: str = "./data/sessions.json", user_id: Optional[str] = None):
+    def __init__(self, session_file: str = "./data/sessions.json", user_id: Optional[str] = None, db_path: Optional[str] = None,
+                 max_history: Optional[int] = None):
         self.session_file = session_file
+        self.db_path = db_path or os.path.splitext(session_file)[0] + ".db"
         self.user_id = user_id or "default_user"
-        self.sessions = self.load_from_file()
-
-        # Asegurar que la sesión del usuario exista
-        if self.user_id not in self.sessions:
-            self.sessions[self.user_id] = []
+        self.max_history = max_history  # mensajes retenidos en RAM; el historial completo queda en disco
+        self.store = get_session_store(self.db_path, legacy_json=session_file)
+        self._history: Optional[Deque[Dict[str, str]]] = None  # se carga recién cuando se pide
+        self._summary: Optional[Tuple[str, int]] = None  # (resumen, último id resumido), cacheado
+        self.summary_lock = threading.Lock()  # un solo plegado de resumen a la vez por sesión
+        self.last_access = time.monotonic()
 
     def add_message(self, role: str, content: str):
-        """Agrega un mensaje al historial y guarda automáticamente"""
-        self.sessions[self.user_id].append({
-            "role": role,
-            "content": content
-        })
-        self.auto_save()
+        """Agrega un mensaje al historial; se persiste con un único INSERT"""
+        self.last_access = time.monotonic()
+        self.store.append(self.user_id, role, content)
+        if self._history is not None:
+            self._history.append({"role": role, "content": content})
 
     def get_history(self) -> List[Dict[str, str]]:
-        """Devuelve el historial de mensajes para el usuario"""
-        return self.sessions.get(self.user_id, [])
+        """Devuelve el historial de mensajes para el usuario (los últimos max_history si hay límite)"""
+        self.last_access = time.monotonic()
+        if self._history is None:
+            self._history = deque(self.store.load(self.user_id, limit=self.max_history), maxlen=self.max_history)
+        return list(self._history)
+
+    def get_recent(self, limit: int, after_id: int = 0) -> List[Dict]:
+        """Los últimos `limit` mensajes (con su id) posteriores a after_id; una consulta indexada."""
+        self.last_access = time.monotonic()
+        return self.store.load_with_ids(self.user_id, after_id=after_id, limit=limit)
+
+    def get_messages_between(self, after_id: int, before_id: int) -> List[Dict]:
+        return self.store.load_with_ids(self.user_id, after_id=after_id, before_id=before_id)
+
+    def get_summary(self) -> Tuple[str, int]:
+        """Resumen de los turnos viejos y hasta qué id cubre. Se lee de disco una sola vez."""
+        if self._summary is None:
+            self._summary = self.store.get_summary(self.user_id)
+        return self._summary
+
+    def set_summary(self, summary: str, covered_until: int):
+        self.store.set_summary(self.user_id, summary, covered_until)
+        self._summary = (summary, covered_until)
 
     def save_to_file(self):
-        """Guarda todas las sesiones en JSON"""
+        """Exporta todas las sesiones a JSON (ya no se usa para persistir cada mensaje)"""
         os.makedirs(os.path.dirname(self.session_file), exist_ok=True)
-        with open(self.session_file, "w", encoding="utf-8") as f:
-            json.dump(self.sessions, f, indent=2, ensure_ascii=False)
+        tmp_path = f"{self.session_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.store.export(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.session_file)
 
     def load_from_file(self) -> Dict[str, List[Dict[str, str]]]:
         """Carga sesiones desde archivo JSON si existe, sino retorna dict vacío"""
@@ -41,11 +201,47 @@ class ConversationMemory:
         else:
             return {}
 
-    def auto_save(self):
-        """Guarda automáticamente después de cada mensaje agregado"""
-        self.save_to_file()
-
     def clear_history(self):
-        """Borra el historial del usuario y guarda"""
-        self.sessions[self.user_id] = []
-        self.auto_save()
+        """Borra el historial del usuario"""
+        self.store.clear(self.user_id)
+        self._history = deque(maxlen=self.max_history)
+        self._summary = ("", 0)
+
+
+class SessionRegistry:
+    """Memorias livianas por sesión de navegador, compartidas por todo el proceso.
+
+    Cada sesión tiene su propio ConversationMemory (user_id = id de sesión) con historial
+    acotado en RAM. Las sesiones inactivas más de idle_ttl segundos se desalojan (su
+    historial sigue en disco) y, si se supera max_sessions, se desaloja la menos reciente.
+    """
+
+    def __init__(self, session_file: str = "./data/sessions.json", max_history: int = 50,
+                 idle_ttl: float = 30 * 60, max_sessions: int = 500):
+        self.session_file = session_file
+        self.max_history = max_history
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, ConversationMemory] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationMemory:
+        with self._lock:
+            self._evict_idle()
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                memory = ConversationMemory(self.session_file, user_id=session_id, max_history=self.max_history)
+                self._sessions[session_id] = memory
+                if len(self._sessions) > self.max_sessions:
+                    oldest = min(self._sessions, key=lambda k: self._sessions[k].last_access)
+                    del self._sessions[oldest]
+            memory.last_access = time.monotonic()
+            return memory
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for session_id in [k for k, m in self._sessions.items() if now - m.last_access > self.idle_ttl]:
+            del self._sessions[session_id]
+
+    def __len__(self) -> int:
+        return len(self._sessions)
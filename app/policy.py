@@ -0,0 +1,42 @@
+import os
+import re
+from typing import Dict, List, Optional
+
+# Consultas cuya respuesta cambia con el tiempo: los PDFs locales no alcanzan y conviene ir a la web
+TIME_SENSITIVE_PATTERN = re.compile(
+    r'\b(cu[aá]ndo|fechas?|eventos?|pr[oó]xim[oa]s?|hoy|mañana|esta semana|este mes|este año|'
+    r'calendario|inscripci[oó]n(es)?|convocatorias?|plazos?|vence|vencimiento|novedades|'
+    r'noticias|actualmente|vigentes?|20\d\d)\b',
+    re.IGNORECASE
+)
+
+
+class RetrievalPolicy:
+    """Decide si una consulta necesita búsqueda web además de la búsqueda local.
+
+    Se escala a la web sólo cuando la consulta parece depender de fechas/eventos o cuando
+    la recuperación local es débil: similitud máxima baja o pocos chunks sobre el umbral.
+    """
+
+    def __init__(self, min_similarity: Optional[float] = None, min_coverage: Optional[float] = None,
+                 time_sensitive_pattern: re.Pattern = TIME_SENSITIVE_PATTERN):
+        self.min_similarity = float(os.getenv("RAG_MIN_SIMILARITY", 0.55)) if min_similarity is None else min_similarity
+        self.min_coverage = float(os.getenv("RAG_MIN_COVERAGE", 0.34)) if min_coverage is None else min_coverage
+        self.time_sensitive_pattern = time_sensitive_pattern
+
+    def is_time_sensitive(self, query: str) -> bool:
+        return bool(self.time_sensitive_pattern.search(query))
+
+    def coverage(self, local_results: List[Dict], top_k: int) -> float:
+        strong = sum(1 for r in local_results if r.get('similarity', 0.0) >= self.min_similarity)
+        return strong / top_k if top_k else 0.0
+
+    def needs_web(self, local_results: List[Dict], top_k: int) -> Optional[str]:
+        """Devuelve el motivo para escalar a la web, o None si lo local alcanza."""
+        if not local_results:
+            return "no_local_results"
+        if max(r.get('similarity', 0.0) for r in local_results) < self.min_similarity:
+            return "low_similarity"
+        if self.coverage(local_results, top_k) < self.min_coverage:
+            return "low_coverage"
+        return None
@@ -2,16 +2,29 @@ import sys
 __import__('pysqlite3')
 sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 
+import os
 import re
+import time
+import json
+import hashlib
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import numpy as np
-import pandas as pd
-from typing import List, Dict, Optional, Union
-from sentence_transformers import SentenceTransformer
+from typing import Any, List, Dict, Optional, Union, Iterable, Iterator, Tuple
 import chromadb
-from sklearn.decomposition import PCA
-import plotly.express as px
 
-from tools import Tools
+from tools import Tools, QueryAnalyzer, Chunk
+from indexer import chunk_id
+from cache import TTLCache, normalize_query
+from policy import RetrievalPolicy
+from lexical import BM25Index, exact_terms, reciprocal_rank_fusion
+from reranker import CrossEncoderReranker
+from embeddings import BatchingEncoder, create_embedding_backend
+from answer_cache import SemanticAnswerCache
+from embedding_store import EmbeddingStore
+from table_store import TableStore
+from tokens import count_tokens
+import tracing
 
 import logging
 logging.basicConfig(
@@ -21,17 +34,55 @@ logging.basicConfig(
     encoding="utf-8"
 )
 
-import tiktoken
-def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
-    try:
-        enc = tiktoken.encoding_for_model(model)
-    except KeyError:
-        enc = tiktoken.get_encoding("cl100k_base")  # fallback
-    return len(enc.encode(text))
+# Los resultados web compiten con los locales, pero a igual puntaje se prefiere el PDF
+WEB_SCORE_WEIGHT = 0.9
+
+def _shingles(text: str, size: int = 8) -> set:
+    words = re.findall(r'\w+', text.lower())
+    return {' '.join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+def pack_context(candidates: List[Dict], max_tokens: int, overlap_threshold: float = 0.7) -> Tuple[str, int]:
+    """Arma el contexto dentro de un presupuesto de tokens.
+
+    Ordena los candidatos por puntaje, descarta los que repiten texto ya elegido (el solapamiento
+    de 100 palabras entre chunks consecutivos duplica mucho contenido) y agrega chunks enteros
+    mientras entren: nunca corta una tabla a la mitad de una fila.
+    """
+    selected, seen, used = [], set(), 0
+    separator_tokens = count_tokens("\n\n")
+    for cand in sorted(candidates, key=lambda c: c["score"], reverse=True):
+        shingles = _shingles(cand["text"])
+        if shingles and len(shingles & seen) / len(shingles) >= overlap_threshold:
+            continue
+        tokens = count_tokens(cand["text"]) + (separator_tokens if selected else 0)
+        if used + tokens > max_tokens:
+            continue
+        selected.append(cand["text"])
+        seen |= shingles
+        used += tokens
+    return "\n\n".join(selected), used
+
+# Distancia coseno: así 'similarity' = 1 - distancia es realmente la similitud coseno y los
+# umbrales de la política de recuperación tienen sentido (con L2 la escala depende de la norma)
+COLLECTION_METADATA = {"hnsw:space": "cosine"}
+
+# Búsqueda híbrida: candidatos por fuente = top_k * HYBRID_CANDIDATES antes de fusionar
+HYBRID_CANDIDATES = 4
+# Re-ranking: la primera etapa trae top_k * RERANK_CANDIDATES candidatos para el cross-encoder
+RERANK_CANDIDATES = 4
+
+def _batched(iterable: Iterable, size: int) -> Iterator[List]:
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
 
 class RAG:
-    def __init__(self, persist_directory: str = "./data/chroma_db", tools: Optional[Tools] = None, tavily_api_key: Optional[str] = None):
-        self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+    def __init__(self, persist_directory: str = "./data/chroma_db", tools: Optional[Tools] = None, tavily_api_key: Optional[str] = None,
+                 cache_size: int = 256, cache_ttl: float = 3600.0):
+        # Encoder intercambiable: PyTorch fp32 o ONNX Runtime int8 (EMBEDDING_BACKEND=onnx)
+        self.model = create_embedding_backend()
+        # Las consultas concurrentes comparten una pasada del encoder (RAG_ENCODE_BATCHING=off lo desactiva)
+        self.query_encoder = BatchingEncoder(self.model) if os.getenv("RAG_ENCODE_BATCHING", "on").lower() != "off" else None
         self.client = chromadb.PersistentClient(path=persist_directory)
         self.persist_directory = persist_directory
 
@@ -40,98 +91,409 @@ class RAG:
         if "documents" in existing:
             self.collection = self.client.get_collection(name="documents")
         else:
-            self.collection = self.client.create_collection(name="documents")
-
-
-        self.embeddings_cache = {}
+            self.collection = self.client.create_collection(name="documents", metadata=COLLECTION_METADATA)
         self.tools = tools or Tools(tavily_api_key=tavily_api_key)
 
+        # Índice léxico BM25 sobre los mismos chunks, persistido junto a la base vectorial
+        data_directory = os.path.dirname(os.path.abspath(persist_directory))
+        self.lexical_index = BM25Index(os.path.join(data_directory, "bm25_index.json"))
+        self._sync_lexical_index()
+        # Copia de los embeddings en disco (memmap) sólo para visualización; nunca residente en RAM
+        self.embedding_store = EmbeddingStore(os.path.join(data_directory, "embeddings"))
+        # Tablas de los planes como filas normalizadas, para consultas exactas sin LLM (las llena el indexador)
+        self.table_store = TableStore(os.path.join(data_directory, "tables.db"))
+
+        # Cache de dos niveles: consulta normalizada -> embedding, y (consulta, top_k, versión) -> resultados.
+        # La versión de la colección cambia con cada escritura, así que los resultados viejos nunca se sirven.
+        self.collection_version = 0
+        self.query_embedding_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.search_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Respuestas del LLM reutilizables entre sesiones para preguntas casi idénticas
+        self.answer_cache = SemanticAnswerCache() if os.getenv("RAG_ANSWER_CACHE", "on").lower() != "off" else None
+
+        # Recuperación local y web en paralelo, cada una con su propio deadline (segundos)
+        self.retrieval_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-retrieval")
+        self.local_timeout = float(os.getenv("RAG_LOCAL_TIMEOUT", 5.0))
+        self.web_timeout = float(os.getenv("RAG_WEB_TIMEOUT", 4.0))
+        self.retrieval_policy = RetrievalPolicy()
+        self.query_analyzer = QueryAnalyzer()
+        self.min_filtered_results = 3
+        self.reranker = CrossEncoderReranker() if os.getenv("RAG_RERANKER", "on").lower() != "off" else None
+
     def load_documents(self, text: str) -> List[str]:
         return [s.strip() for s in re.split(r'\.\s*', text) if len(s.strip()) > 10]
 
     def index_documents(self, documents: Union[str, List], document_name: str = "default") -> bool:
+        """Indexa (o reemplaza) una lista de documentos de una vez, por el mismo camino que
+        index_documents_stream: ids derivados del contenido, así que re-indexar no duplica."""
+        if isinstance(documents, str):
+            documents = [documents]
+        if not documents:
+            return False
         try:
-            if isinstance(documents, str):
-                documents = [documents]
-            if not documents:
-                return False
-
-            if hasattr(documents[0], 'text') and hasattr(documents[0], 'metadata'):
-                raw_texts = [d.text for d in documents]
-                metadatas = [d.metadata for d in documents]
+            stats = self._write_stream(self._document_items(documents, document_name), skip_existing=False)
+            return stats["failed"] == 0
+        except Exception as e:
+            print(f"❌ Error indexando documentos: {e}")
+            return False
+
+    @staticmethod
+    def _document_items(documents: Iterable, document_name: str) -> Iterator[Tuple[str, str, Dict]]:
+        """(id, texto, metadata) por documento. Los chunks de PDF (con source y chunk_type, ver
+        Tools.iter_pdfs_from_folder) usan el mismo chunk_id que IncrementalIndexer; el resto,
+        el hash del texto bajo document_name. Los repetidos se distinguen por ocurrencia."""
+        seen: Dict[tuple, int] = {}
+        for doc in documents:
+            if hasattr(doc, 'text') and hasattr(doc, 'metadata'):
+                text, metadata = doc.text, dict(doc.metadata)
             else:
-                raw_texts = documents
-                metadatas = [{"source": document_name, "sentence_id": i} for i in range(len(documents))]
-
-            embeddings = self.model.encode(raw_texts)
-            ids = [f"{document_name}_{i}" for i in range(len(raw_texts))]
-
-            self.collection.add(
-                embeddings=embeddings.tolist(),
-                documents=raw_texts,
-                ids=ids,
-                metadatas=metadatas
-            )
-
-            self.embeddings_cache[document_name] = {
-                'embeddings': embeddings,
-                'documents': raw_texts
-            }
+                text, metadata = doc, {"source": document_name}
+            if 'chunk_type' in metadata and 'source' in metadata:
+                base = (metadata['source'], metadata['chunk_type'], text)
+                occurrence = seen.get(base, 0)
+                seen[base] = occurrence + 1
+                chunk = Chunk(content=text, chunk_type=metadata['chunk_type'], metadata=metadata, source=metadata['source'])
+                yield chunk_id(metadata['source'], chunk, occurrence), text, metadata
+                continue
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            occurrence = seen.get(digest, 0)
+            seen[digest] = occurrence + 1
+            yield f"{document_name}_{digest[:20]}_{occurrence}", text, metadata
+
+    def index_documents_stream(self, documents: Iterable, document_name: str = "default",
+                               batch_size: int = 64, progress_path: Optional[str] = None) -> Dict[str, int]:
+        """Indexa un flujo de documentos (p. ej. Tools.iter_pdfs_from_folder) en lotes de tamaño fijo.
+
+        La memoria queda acotada a un par de lotes, cada lote se escribe en Chroma apenas está listo
+        y los ids se derivan del contenido, así que una corrida interrumpida puede retomarse:
+        los chunks ya escritos se detectan y no se vuelven a embeber.
+        """
+        items = self._document_items([documents] if isinstance(documents, str) else documents, document_name)
+        return self._write_stream(items, batch_size=batch_size, progress_path=progress_path)
+
+    def upsert_chunks(self, ids: List[str], texts: List[str], metadatas: List[Dict], batch_size: int = 64) -> bool:
+        """Embebe e inserta (o reemplaza) chunks con ids estables."""
+        if not ids:
             return True
+        stats = self._write_stream(zip(ids, texts, metadatas), batch_size=batch_size, skip_existing=False)
+        return stats["failed"] == 0
+
+    def _write_stream(self, items: Iterable[Tuple[str, str, Dict]], batch_size: int = 64,
+                      progress_path: Optional[str] = None, skip_existing: bool = True) -> Dict[str, int]:
+        progress = {"written": 0, "skipped": 0, "failed": 0, "batches": 0}
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chroma-writer")
+        pending = None
+        try:
+            for batch in _batched(items, batch_size):
+                if skip_existing:
+                    existing = set(self.collection.get(ids=[b[0] for b in batch], include=[])["ids"])
+                    progress["skipped"] += len(existing)
+                    batch = [b for b in batch if b[0] not in existing]
+                    if not batch:
+                        continue
+                try:
+                    embeddings = self.model.encode([b[1] for b in batch], batch_size=batch_size)
+                except Exception as e:
+                    logging.error(f"❌ Error embebiendo lote de {len(batch)} chunks: {e}")
+                    progress["failed"] += len(batch)
+                    continue
+                # El lote anterior se escribe mientras este se codificaba; recién ahora se espera
+                if pending is not None:
+                    self._merge_progress(progress, pending.result(), progress_path)
+                pending = writer.submit(self._write_batch, batch, embeddings)
+            if pending is not None:
+                self._merge_progress(progress, pending.result(), progress_path)
+        finally:
+            writer.shutdown(wait=True)
+            if progress["written"]:
+                self.lexical_index.save()
+                self.embedding_store.save()
+                self._invalidate_search_cache()
+        logging.info(f"[RAG Index] Escritura por lotes finalizada: {progress}")
+        return progress
+
+    def _write_batch(self, batch: List[Tuple[str, str, Dict]], embeddings) -> Dict[str, int]:
+        ids, texts, metadatas = (list(x) for x in zip(*batch))
+        try:
+            self.collection.upsert(ids=ids, embeddings=embeddings.tolist(), documents=texts, metadatas=metadatas)
+            self.lexical_index.add(ids, texts, metadatas)
+            self.embedding_store.add(ids, embeddings, [(m or {}).get("source", "local") for m in metadatas])
+            return {"written": len(ids), "failed": 0}
+        except Exception as e:
+            # Un chunk inválido no debe tirar el lote entero: se reintenta de a uno
+            logging.warning(f"⚠️ Falló el lote ({e}), reintentando chunk por chunk")
+        written = failed = 0
+        for i, cid in enumerate(ids):
+            try:
+                self.collection.upsert(ids=[cid], embeddings=[embeddings[i].tolist()], documents=[texts[i]], metadatas=[metadatas[i]])
+                self.lexical_index.add([cid], [texts[i]], [metadatas[i]])
+                self.embedding_store.add([cid], embeddings[i:i + 1], [(metadatas[i] or {}).get("source", "local")])
+                written += 1
+            except Exception as e:
+                logging.error(f"❌ Chunk {cid} descartado: {e}")
+                failed += 1
+        return {"written": written, "failed": failed}
+
+    @staticmethod
+    def _merge_progress(progress: Dict[str, int], result: Dict[str, int], progress_path: Optional[str]):
+        progress["written"] += result["written"]
+        progress["failed"] += result["failed"]
+        progress["batches"] += 1
+        if progress_path:
+            tmp_path = f"{progress_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(progress, f)
+            os.replace(tmp_path, progress_path)
+
+    def update_chunk_metadata(self, ids: List[str], metadatas: List[Dict]) -> bool:
+        """Actualiza sólo la metadata de chunks existentes, sin volver a calcular embeddings."""
+        if not ids:
+            return True
+        try:
+            self.collection.update(ids=ids, metadatas=metadatas)
+            self.lexical_index.update_sources(ids, metadatas)
+            self.lexical_index.save()
+            self._invalidate_search_cache()
+            return True
+        except Exception as e:
+            logging.error(f"❌ Error actualizando metadata: {e}")
+            return False
 
+    def delete_chunks(self, ids: List[str]) -> bool:
+        if not ids:
+            return True
+        try:
+            self.collection.delete(ids=list(ids))
+            self.lexical_index.remove(ids)
+            self.lexical_index.save()
+            self.embedding_store.remove(ids)
+            self.embedding_store.save()
+            self._invalidate_search_cache()
+            return True
         except Exception as e:
-            print(f"❌ Error indexando documentos: {e}")
+            logging.error(f"❌ Error eliminando chunks: {e}")
             return False
 
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+    def _invalidate_search_cache(self):
+        self.collection_version += 1
+        self.search_cache.clear()
+        if self.answer_cache:
+            self.answer_cache.clear()
+
+    def encode_query(self, query: str) -> List[float]:
+        key = normalize_query(query)
+        with tracing.span("encode") as attrs:
+            embedding = self.query_embedding_cache.get(key)
+            attrs["cached"] = embedding is not None
+            if embedding is None:
+                if self.query_encoder is not None:
+                    embedding = self.query_encoder.encode_one(query).tolist()
+                else:
+                    embedding = self.model.encode([query])[0].tolist()
+                self.query_embedding_cache.set(key, embedding)
+        return embedding
+
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            'query_embeddings': self.query_embedding_cache.stats(),
+            'search_results': self.search_cache.stats(),
+            'answers': self.answer_cache.stats() if self.answer_cache else {},
+            'query_encoder': self.query_encoder.stats() if self.query_encoder else {},
+            'collection_version': self.collection_version
+        }
+
+    def _sync_lexical_index(self):
+        """Reconstruye el índice BM25 desde Chroma si no coincide con la colección (p. ej. primera vez)."""
+        total = self.collection.count()
+        if len(self.lexical_index) == total:
+            return
+        logging.info(f"[RAG Lexical] Reconstruyendo índice BM25 ({len(self.lexical_index)} != {total})")
+        self.lexical_index.clear()
+        for offset in range(0, total, 1000):
+            data = self.collection.get(include=["documents", "metadatas"], limit=1000, offset=offset)
+            self.lexical_index.add(data["ids"], data["documents"], data["metadatas"])
+        self.lexical_index.save()
+
+    def _sync_embedding_store(self):
+        """Completa el store de embeddings desde Chroma si no coincide con la colección.
+        Se llama recién al visualizar, así que no suma tiempo al arranque."""
+        total = self.collection.count()
+        if len(self.embedding_store) == total:
+            return
+        logging.info(f"[RAG Embeddings] Reconstruyendo store de embeddings ({len(self.embedding_store)} != {total})")
+        self.embedding_store.clear()
+        for offset in range(0, total, 1000):
+            data = self.collection.get(include=["embeddings", "metadatas"], limit=1000, offset=offset)
+            sources = [(m or {}).get("source", "local") for m in data["metadatas"]]
+            self.embedding_store.add(data["ids"], data["embeddings"], sources)
+        self.embedding_store.save()
+
+    def _exact_lexical_results(self, query: str, lexical: List[Tuple[str, float]], top_k: int) -> Optional[List[Dict]]:
+        """Atajo léxico: si la consulta trae términos exactos (teléfonos, códigos, ordenanzas) y hay
+        chunks que los contienen a todos, se devuelven esos chunks en el orden de BM25, sin la
+        consulta vectorial, la fusión ni el re-ranking. La similitud es el coseno real con el
+        embedding guardado de cada chunk, así RetrievalPolicy puede seguir escalando a la web."""
+        terms = exact_terms(query)
+        if not terms or not lexical:
+            return None
+        hits = [(doc_id, score) for doc_id, score in lexical if self.lexical_index.contains_all(doc_id, terms)][:top_k]
+        if not hits:
+            return None
+        infos: Dict[str, Dict] = {}
+        self._fill_missing_similarities(self.encode_query(query), infos, [doc_id for doc_id, _ in hits])
+        return [{**infos[doc_id], 'match': 'lexical', 'lexical_score': score} for doc_id, score in hits if doc_id in infos]
+
+    def _vector_search(self, query: str, n_results: int, where: Optional[Dict] = None) -> Tuple[List[float], Dict[str, Dict], List[str]]:
+        embedding = self.encode_query(query)
+        with tracing.span("chroma", op="query", filtered=bool(where)):
+            if where:
+                result = self.collection.query(query_embeddings=[embedding], n_results=n_results, where=where)
+            else:
+                result = self.collection.query(query_embeddings=[embedding], n_results=n_results)
+        ranking, infos = [], {}
+        for doc_id, doc, dist, meta in zip(result['ids'][0], result['documents'][0], result['distances'][0], result['metadatas'][0]):
+            ranking.append(doc_id)
+            infos[doc_id] = {
+                'document': doc,
+                'similarity': 1 - dist,
+                'source': meta.get('source', 'local'),
+                'distance': dist
+            }
+        return embedding, infos, ranking
+
+    def _fill_missing_similarities(self, embedding: List[float], infos: Dict[str, Dict], ids: List[str]):
+        """Los chunks que sólo trajo BM25 no tienen distancia: se calcula el coseno con su embedding guardado."""
+        if not ids:
+            return
+        with tracing.span("chroma", op="get", ids=len(ids)):
+            data = self.collection.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+        query_vec = np.asarray(embedding, dtype=np.float32)
+        for doc_id, emb, doc, meta in zip(data['ids'], data['embeddings'], data['documents'], data['metadatas']):
+            emb = np.asarray(emb, dtype=np.float32)
+            similarity = float(np.dot(query_vec, emb) / (np.linalg.norm(query_vec) * np.linalg.norm(emb) or 1.0))
+            infos[doc_id] = {'document': doc, 'similarity': similarity, 'source': meta.get('source', 'local'), 'distance': 1 - similarity}
+
+    def _search_once(self, query: str, top_k: int, hybrid: bool, filters: Dict) -> List[Dict]:
+        where = self.query_analyzer.to_where(filters)
+        lexical = []
+        if hybrid:
+            with tracing.span("bm25"):
+                lexical = self.lexical_index.search(query, top_k=top_k * HYBRID_CANDIDATES, filters=filters)
+        documents_info = self._exact_lexical_results(query, lexical, top_k)
+        if documents_info is not None:
+            logging.info(f"[RAG Search] Respuesta desde el índice léxico: {query}")
+        elif lexical:
+            # Fusión por ranking recíproco entre el orden vectorial y el de BM25
+            embedding, infos, ranking = self._vector_search(query, top_k * HYBRID_CANDIDATES, where)
+            fused = reciprocal_rank_fusion([ranking, [doc_id for doc_id, _ in lexical]])[:top_k]
+            self._fill_missing_similarities(embedding, infos, [doc_id for doc_id, _ in fused if doc_id not in infos])
+            documents_info = [{**infos[doc_id], 'rrf_score': score} for doc_id, score in fused if doc_id in infos]
+        else:
+            _, infos, ranking = self._vector_search(query, top_k, where)
+            documents_info = [infos[doc_id] for doc_id in ranking]
+        return documents_info
+
+    def search(self, query: str, top_k: int = 3, hybrid: bool = True, use_filters: bool = True, rerank: bool = True) -> List[Dict]:
         if not query.strip():
             return []
+        rerank = rerank and self.reranker is not None
+        cache_key = (normalize_query(query), top_k, hybrid, use_filters, rerank, self.collection_version)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"[RAG Search] Cache hit: {query}")
+            return [dict(info) for info in cached]
         try:
-            embedding = self.model.encode([query])
-            result = self.collection.query(query_embeddings=embedding.tolist(), n_results=top_k)
-            
-            documents_info = [
-                {
-                    'document': doc,
-                    'similarity': 1 - dist,
-                    'source': meta.get('source', 'local'),
-                    'distance': dist
-                }
-                for doc, dist, meta in zip(result['documents'][0], result['distances'][0], result['metadatas'][0])
-            ]
+            # Filtros por carrera/año/sección detectados en la pregunta; si devuelven muy pocos
+            # resultados se van relajando hasta llegar a la búsqueda sin filtro
+            # Con re-ranking, la primera etapa trae más candidatos de los que se van a devolver
+            n_candidates = top_k * RERANK_CANDIDATES if rerank else top_k
+            filters = self.query_analyzer.analyze(query) if use_filters else {}
+            for step in self.query_analyzer.relaxations(filters):
+                documents_info = self._search_once(query, n_candidates, hybrid, step)
+                if len(documents_info) >= min(top_k, self.min_filtered_results) or not step:
+                    break
+            if filters:
+                logging.info(f"[RAG Search] Filtros detectados: {filters}, aplicados: {step}")
+
+            if rerank and not any(info.get('match') == 'lexical' for info in documents_info):
+                try:
+                    with tracing.span("rerank", candidates=len(documents_info)) as attrs:
+                        documents_info, attrs["reranked"] = self.reranker.rerank(query, documents_info, top_k)
+                except Exception as e:
+                    logging.error(f"❌ Error en re-ranking, se usa el orden original: {e}")
+            documents_info = documents_info[:top_k]
 
             # Loguear info de los docs recuperados
             logging.info(f"[RAG Search] Query: {query}")
             for info in documents_info:
                 logging.info(f"[RAG Search] Doc source: {info['source']}, Similarity: {info['similarity']:.4f}")
 
+            self.search_cache.set(cache_key, [dict(info) for info in documents_info])
             return documents_info
         except Exception as e:
             logging.error(f"❌ Error en búsqueda: {e}")
             return []
 
-    def get_rag_results(self, query: str, top_k: int = 3, include_web: bool = True) -> Dict:
+    def search_web(self, query: str, max_results: int = 3) -> dict:
+        provider = "tavily" if self.tools.tavily_client else "duckduckgo"
+        with tracing.span("web", provider=provider):
+            if provider == "tavily":
+                return self.tools.search_web_tavily(query, max_results=max_results)
+            return self.tools.search_web_duckduckgo(query, max_results=max_results)
+
+    def _retrieve_concurrently(self, query: str, top_k: int,
+                               timeouts: Dict[str, float]) -> Tuple[Dict[str, Any], List[str]]:
+        """Lanza a la vez las fuentes pedidas ('local' y/o 'web', con su timeout en segundos) y
+        espera a cada una hasta su deadline. Lo que no llegó a tiempo se descarta y se informa
+        en la lista de fuentes vencidas."""
+        start = time.monotonic()
+        sources = {"local": self.search, "web": self.search_web}
+        # bind() propaga la traza de la consulta a los hilos del executor
+        futures = {name: self.retrieval_executor.submit(tracing.bind(sources[name]), query, top_k) for name in timeouts}
+        deadlines = {name: start + timeout for name, timeout in timeouts.items()}
+
+        outputs, timed_out = {}, []
+        for name, future in futures.items():
+            try:
+                outputs[name] = future.result(timeout=max(0.0, deadlines[name] - time.monotonic()))
+            except FuturesTimeoutError:
+                future.cancel()
+                timed_out.append(name)
+                logging.warning(f"⏱️ [RAG Results] La fuente '{name}' superó su deadline para: {query}")
+            except Exception as e:
+                logging.error(f"❌ [RAG Results] Error en la fuente '{name}': {e}")
+        return outputs, timed_out
+
+    def get_rag_results(self, query: str, top_k: int = 3, include_web: bool = True, concurrent: bool = True,
+                        local_timeout: Optional[float] = None, web_timeout: Optional[float] = None) -> Dict:
+        if concurrent:
+            timeouts = {"local": self.local_timeout if local_timeout is None else local_timeout}
+            if include_web:
+                timeouts["web"] = self.web_timeout if web_timeout is None else web_timeout
+            outputs, timed_out = self._retrieve_concurrently(query, top_k, timeouts)
+            return self._build_results(query, outputs.get("local") or [], outputs.get("web"), timed_out)
+        local_results = self.search(query, top_k=top_k)
+        web_results = self.search_web(query, max_results=top_k) if include_web else None
+        return self._build_results(query, local_results, web_results, [])
+
+    def _build_results(self, query: str, local_results: List[Dict], web_results: Optional[dict],
+                       timed_out: List[str]) -> Dict:
         results = {
             "documents": [],
             "web_results": [],
             "combined_context": "",
             "sources": [],
-            "confidence": 0.0
+            "confidence": 0.0,
+            "timed_out": timed_out
         }
 
-        local_results = self.search(query, top_k=top_k)
-        web_results = None
-        if include_web:
-            if self.tools.tavily_client:
-                web_results = self.tools.search_web_tavily(query, max_results=top_k)
-            else:
-                web_results = self.tools.search_web_duckduckgo(query, max_results=top_k)
-
         context_parts = []
         similarities = []
+        candidates = []
 
         for res in local_results:
             context_parts.append(f"📄 {res['document']}")
+            candidates.append({"text": context_parts[-1], "score": res['similarity'], "kind": "local"})
             similarities.append(res['similarity'])
             results["documents"].append(res)
             results["sources"].append(res['source'])
@@ -142,16 +504,20 @@ class RAG:
                 title = item.get("title", "")
                 url = item.get("url", "")
                 context_parts.append(f"🌐 {title}: {snippet} ({url})")
+                candidates.append({"text": context_parts[-1], "score": float(item.get("score") or 0.0) * WEB_SCORE_WEIGHT, "kind": "web"})
                 results["web_results"].append({'title': title, 'snippet': snippet, 'url': url})
                 results["sources"].append(url)
 
         results["combined_context"] = "\n\n".join(context_parts)
+        results["candidates"] = candidates
         results["confidence"] = float(np.mean(similarities)) if similarities else 0.0
 
         # Log de contexto combinado y fuentes
         logging.info(f"[RAG Results] Query: {query}")
         logging.info(f"[RAG Results] Sources: {results['sources']}")
         logging.info(f"[RAG Results] Confidence: {results['confidence']:.4f}")
+        if results["timed_out"]:
+            logging.info(f"[RAG Results] Fuentes vencidas: {results['timed_out']}")
         logging.debug(f"[RAG Results] Combined context:\n{results['combined_context'][:1000]}")  # Limitar para no llenar logs
 
         for i, part in enumerate(context_parts):
@@ -159,9 +525,45 @@ class RAG:
 
         return results
 
-    def get_context(self, query: str, max_context_length: int = 7000, include_web: bool = True) -> str:
+    def retrieve(self, query: str, policy: Optional[RetrievalPolicy] = None, top_k: int = 3) -> Dict:
+        """Recuperación guiada por política: la web sólo se consulta si la consulta es sensible
+        al tiempo o si lo local es débil. El camino tomado queda en results['decision_path'].
+
+        Las consultas sensibles al tiempo lanzan local y web a la vez. En el resto, la web
+        depende de lo que devuelva lo local, así que las fuentes van una tras otra: primero
+        la local con su deadline y, si hace falta, la web con el suyo. No se lanza la web
+        de forma especulativa para no pagar una búsqueda externa en cada consulta."""
+        policy = policy or self.retrieval_policy
+        if policy.is_time_sensitive(query):
+            results = self.get_rag_results(query, top_k=top_k, include_web=True)
+            decision_path = ["time_sensitive", "rag_search", "web_search"]
+        else:
+            outputs, timed_out = self._retrieve_concurrently(query, top_k, {"local": self.local_timeout})
+            local_results = outputs.get("local") or []
+            reason = policy.needs_web(local_results, top_k)
+            web_results = None
+            if reason:
+                outputs, web_timed_out = self._retrieve_concurrently(query, top_k, {"web": self.web_timeout})
+                web_results = outputs.get("web")
+                timed_out += web_timed_out
+            results = self._build_results(query, local_results, web_results, timed_out)
+            decision_path = ["rag_search", reason, "web_search"] if reason else ["rag_search", "rag_only"]
+        if "web" in results["timed_out"]:
+            decision_path.append("web_timeout")
+        results["decision_path"] = decision_path
+        logging.info(f"[RAG Policy] {query} -> {decision_path}")
+        return results
+
+    def build_context(self, rag_info: Dict, max_tokens: int = 1800) -> str:
+        with tracing.span("context", max_tokens=max_tokens) as attrs:
+            context, used = pack_context(rag_info.get("candidates", []), max_tokens)
+            attrs["tokens"] = used
+        logging.info(f"[RAG Context] {used}/{max_tokens} tokens usados")
+        return context
+
+    def get_context(self, query: str, max_tokens: int = 1800, include_web: bool = True) -> str:
         rag_info = self.get_rag_results(query, include_web=include_web)
-        return rag_info["combined_context"][:max_context_length]
+        return self.build_context(rag_info, max_tokens=max_tokens)
 
     def get_collection_stats(self) -> Dict[str, Union[int, str]]:
         try:
@@ -175,28 +577,36 @@ class RAG:
     def clear_collection(self) -> bool:
         try:
             self.client.delete_collection(name="documents")
-            self.collection = self.client.create_collection(name="documents")
-            self.embeddings_cache.clear()
+            self.collection = self.client.create_collection(name="documents", metadata=COLLECTION_METADATA)
+            self.lexical_index.clear()
+            self.lexical_index.save()
+            self.embedding_store.clear()
+            self.embedding_store.save()
+            self._invalidate_search_cache()
             return True
         except Exception as e:
             print(f"❌ Error limpiando colección: {e}")
             return False
 
     def visualize_embeddings(self, document_name: Optional[str] = None):
-        if not self.embeddings_cache:
-            return None
         try:
-            if document_name and document_name in self.embeddings_cache:
-                data = self.embeddings_cache[document_name]
-                embeddings, documents = data['embeddings'], data['documents']
-                sources = [document_name] * len(documents)
-            else:
-                embeddings, documents, sources = [], [], []
-                for name, data in self.embeddings_cache.items():
-                    embeddings.append(data['embeddings'])
-                    documents.extend(data['documents'])
-                    sources.extend([name] * len(data['documents']))
-                embeddings = np.vstack(embeddings)
+            self._sync_embedding_store()
+            if not len(self.embedding_store):
+                return None
+            # Sólo se usan acá: se importan al visualizar para no pagarlos al arrancar
+            import pandas as pd
+            import plotly.express as px
+            from sklearn.decomposition import PCA
+
+            if document_name not in self.embedding_store.documents():
+                document_name = None
+            ids, sources, embeddings = self.embedding_store.load_vectors(document_name)
+            # Los textos no se duplican en el store: se piden a Chroma sólo para los puntos graficados
+            texts = {}
+            for batch in _batched(ids, 1000):
+                data = self.collection.get(ids=batch, include=["documents"])
+                texts.update(zip(data["ids"], data["documents"]))
+            documents = [texts.get(doc_id, "") for doc_id in ids]
 
             pca = PCA(n_components=2)
             coords = pca.fit_transform(embeddings)
@@ -212,7 +622,7 @@ class RAG:
             return None
 
     def chat(self, query: str) -> str:
-        context = self.get_context(query, max_context_length=1500)
+        context = self.get_context(query, max_tokens=400)
         logging.info(f"[Chat] Context length: {len(context)}")
         logging.debug(f"[Chat] Context completo:\n{context}")
         if not context.strip():
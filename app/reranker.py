@@ -0,0 +1,112 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+from cache import TTLCache, normalize_query
+
+DEFAULT_RERANKER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # multilingüe, chico, corre bien en CPU
+
+
+class CrossEncoderReranker:
+    """Segunda etapa de recuperación: re-ordena los candidatos con un cross-encoder.
+
+    Los puntajes (consulta, chunk) se guardan en cache. El scoring corre en un hilo aparte y
+    se lo espera como mucho time_budget: si no terminó, o si el modelo todavía no está cargado
+    (se precarga con warmup() al iniciar), se devuelve el orden de la primera etapa. Un scoring
+    que venció igual termina en segundo plano y deja sus puntajes en el cache. Hay como mucho
+    un scoring en curso: mientras el anterior no termina, los pedidos nuevos usan el orden de
+    la primera etapa sin encolar otro, así los vencidos no se acumulan ni le quitan CPU al encoder.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, time_budget: Optional[float] = None,
+                 batch_size: int = 16, cache_size: int = 4096, cache_ttl: float = 6 * 3600):
+        self.model_name = model_name or os.getenv("RAG_RERANKER_MODEL", DEFAULT_RERANKER_MODEL)
+        self.time_budget = float(os.getenv("RAG_RERANK_BUDGET", 0.3)) if time_budget is None else time_budget
+        self.batch_size = batch_size
+        self.score_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._loading = None
+        self._scoring = None
+        self._scoring_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="reranker")
+        self.fallbacks = 0
+
+    @property
+    def model(self):
+        # Carga perezosa: el modelo sólo se baja/carga la primera vez que se re-rankea
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, max_length=512, device="cpu")
+        return self._model
+
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def warmup(self):
+        self.model.predict([("warmup", "warmup")])
+
+    def _load_in_background(self):
+        with self._load_lock:
+            if self._loading is None:
+                self._loading = self.executor.submit(self.warmup)
+                self._loading.add_done_callback(
+                    lambda f: f.exception() and logging.error(f"❌ [Reranker] No se pudo cargar el modelo: {f.exception()}"))
+
+    def _score(self, query: str, candidates: List[Dict], pending: List[int]) -> Dict[int, float]:
+        scores = {}
+        for offset in range(0, len(pending), self.batch_size):
+            batch = pending[offset:offset + self.batch_size]
+            batch_scores = self.model.predict([(query, candidates[i]['document']) for i in batch], batch_size=len(batch))
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self.score_cache.set(self._key(query, candidates[i]['document']), float(score))
+        return scores
+
+    def _fallback(self, reason: str):
+        self.fallbacks += 1
+        logging.warning(f"⏱️ [Reranker] {reason}, se usa el orden de la primera etapa")
+
+    @staticmethod
+    def _key(query: str, document: str) -> Tuple[str, str]:
+        return normalize_query(query), hashlib.sha1(document.encode("utf-8")).hexdigest()
+
+    def rerank(self, query: str, candidates: List[Dict], top_k: int) -> Tuple[List[Dict], bool]:
+        """Devuelve (resultados, reranked). reranked=False indica que se usó el orden original."""
+        if len(candidates) <= 1:
+            return candidates[:top_k], False
+        if not self.ready():
+            self._load_in_background()
+            self._fallback("Modelo todavía no cargado")
+            return candidates[:top_k], False
+        start = time.perf_counter()
+        scores: Dict[int, float] = {}
+        pending = []
+        for i, cand in enumerate(candidates):
+            cached = self.score_cache.get(self._key(query, cand['document']))
+            if cached is None:
+                pending.append(i)
+            else:
+                scores[i] = cached
+
+        if pending:
+            with self._scoring_lock:
+                if self._scoring is not None and not self._scoring.done():
+                    self._fallback("Hay un scoring anterior en curso")
+                    return candidates[:top_k], False
+                future = self._scoring = self.executor.submit(self._score, query, candidates, pending)
+            try:
+                scores.update(future.result(timeout=max(0.0, self.time_budget - (time.perf_counter() - start))))
+            except FuturesTimeoutError:
+                self._fallback(f"Presupuesto de {self.time_budget:.2f}s agotado")
+                return candidates[:top_k], False
+
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:top_k]
+        logging.info(f"[Reranker] {len(candidates)} candidatos re-rankeados en {time.perf_counter() - start:.3f}s")
+        return [{**candidates[i], 'rerank_score': scores[i]} for i in order], True
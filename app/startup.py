@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import logging
+import importlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Módulos pesados en el orden en que los necesita la app
+HEAVY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "chromadb",
+    "tiktoken",
+    "pdfplumber",
+    "langchain_core",
+    "llama_index.core",
+    "duckduckgo_search",
+    "google.generativeai",
+    "sklearn",
+    "pandas",
+    "plotly.express",
+]
+
+
+class BackgroundLoader:
+    """Construye recursos pesados (encoder, Chroma, Gemini) en un hilo aparte para que la UI
+    pueda dibujarse mientras tanto. get() bloquea sólo si todavía no terminó."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.started_at = time.perf_counter()
+        self.elapsed: Optional[float] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup")
+        self._future: Future = self._executor.submit(self._run, factory)
+
+    def _run(self, factory: Callable[[], Any]) -> Any:
+        try:
+            return factory()
+        finally:
+            self.elapsed = time.perf_counter() - self.started_at
+            logging.info(f"🔥 Precarga en segundo plano finalizada en {self.elapsed:.2f}s")
+            self._executor.shutdown(wait=False)
+
+    @property
+    def future(self) -> Future:
+        return self._future
+
+    def ready(self) -> bool:
+        return self._future.done()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        return self._future.result(timeout=timeout)
+
+    def error(self) -> Optional[BaseException]:
+        """La excepción de la precarga, si terminó con error."""
+        return self._future.exception() if self._future.done() else None
+
+
+def profile_imports(modules: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    """Tiempo de import de cada módulo, en orden. Cada valor es el costo incremental: lo que
+    ya cargó un módulo anterior (p. ej. torch para sentence_transformers) no se vuelve a contar."""
+    results = []
+    for name in modules or HEAVY_MODULES:
+        if name in sys.modules:
+            results.append((name, 0.0))
+            continue
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo importar {name}: {e}")
+        results.append((name, time.perf_counter() - t0))
+    return results
+
+
+def log_import_profile(modules: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    results = profile_imports(modules)
+    for name, seconds in sorted(results, key=lambda r: r[1], reverse=True):
+        logging.info(f"⏱️ [Import] {name}: {seconds:.3f}s")
+    logging.info(f"⏱️ [Import] Total: {sum(s for _, s in results):.3f}s")
+    return results
+
+
+def cargar_recursos(data_folder: str = "data", persist_path: str = "./data/chroma_db") -> Dict[str, Any]:
+    """Recursos pesados compartidos por todo el proceso: encoder, Chroma y modelo de Gemini.
+    Los usan tanto la UI de Streamlit como la API HTTP; corre en un hilo de fondo
+    (ver BackgroundLoader), nunca en el hilo que atiende pedidos."""
+    logging.info("📦 Iniciando carga del motor de chat...")
+    if os.getenv("CEUT_IMPORT_PROFILE") == "1":
+        log_import_profile()
+
+    from rag import RAG
+    from indexer import IncrementalIndexer
+    from tools import Tools
+    from agent import LLMGateway, create_gemini_model
+
+    tools = Tools(tavily_api_key=os.getenv("TAVILY_API_KEY"))
+    logging.info(f"🔧 Tools instanciado correctamente: {type(tools)}")
+
+    # Paso 1: Sincronizar el índice con los PDFs de 'data/' (sólo se procesa lo que cambió)
+    rag = RAG(persist_directory=persist_path, tools=tools)
+
+    stats = rag.get_collection_stats()
+    logging.info(f"📊 DOCUMENTOS EN BASE: {stats['total_documents']}")
+
+    indexer = IncrementalIndexer(rag, tools=tools)
+    sync_stats = indexer.sync(data_folder)
+    stats = rag.get_collection_stats()
+    if sync_stats["updated"] or sync_stats["removed"]:
+        logging.info(f"✅ Índice actualizado. Total documentos indexados: {stats['total_documents']}")
+    else:
+        logging.info(f"📚 Sistema RAG inicializado. Documentos ya indexados: {stats['total_documents']}")
+
+    # El cross-encoder se carga acá y no en la primera consulta (hasta entonces se usa el orden de la primera etapa)
+    if rag.reranker is not None:
+        try:
+            rag.reranker.warmup()
+            logging.info("🔁 Re-ranker cargado")
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo cargar el re-ranker, se usa el orden de la primera etapa: {e}")
+
+    # Paso 2: Modelo de Gemini detrás de un único gateway (single-flight, límite de tasa y reintentos)
+    model = LLMGateway(create_gemini_model())
+
+    return {"rag": rag, "tools": tools, "model": model}
+
+
+if __name__ == "__main__":
+    # python app/startup.py  -> perfil de imports en un proceso limpio
+    for name, seconds in profile_imports():
+        print(f"{name:<24} {seconds:8.3f}s")
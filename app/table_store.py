@@ -0,0 +1,379 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools import Chunk, _strip_accents, detect_query_carrera, mentioned_carreras, plan_carrera
+
+PLAN_NAMES = {
+    'mecatronica': 'Tecnicatura Superior en Mecatrónica',
+    'tecnologias_informacion': 'Tecnicatura Superior en Tecnologías de la Información',
+    'sistemas': 'Ingeniería en Sistemas de Información',
+    'industrial': 'Ingeniería Industrial',
+    'civil': 'Ingeniería Civil',
+    'mecanica': 'Ingeniería Mecánica',
+    'electrica': 'Ingeniería en Energía Eléctrica',
+}
+
+ORDINALS = {'primer': 1, 'primero': 1, 'segundo': 2, 'tercer': 3, 'tercero': 3, 'cuarto': 4, 'quinto': 5, 'sexto': 6}
+ROMAN = {'i': 1, 'ii': 2, 'iii': 3, 'iv': 4, 'v': 5, 'vi': 6}
+NUMERAL_TOKENS = {'1': 'i', '2': 'ii', '3': 'iii', '4': 'iv', '5': 'v', '6': 'vi'}
+
+_HEADING = re.compile(r'^(primer|segundo|tercer|cuarto|quinto|sexto)\s+(nivel|ano|cuatrimestre)$')
+_QUERY_LEVEL = re.compile(
+    r'\b(1|2|3|4|5|6|primer|primero|segundo|tercer|tercero|cuarto|quinto|sexto)(?:°|o|ro|er|do|to)?\s+(ano|nivel|cuatrimestre)\b')
+_INTENTS = [
+    ('correlativas', re.compile(r'\bcorrelativ')),
+    ('horas', re.compile(r'\bhoras\b|\bcarga horaria\b')),
+    ('nivel', re.compile(r'\b(que|cual|cuando)\b.*\b(nivel|ano|cuatrimestre)\b|\bse (cursa|dicta)\b')),
+    ('listado', re.compile(r'\b(materias|asignaturas)\b')),
+]
+MAX_NGRAM = 10
+
+# Palabras que puede tener una consulta puntual además de la materia: relleno de la pregunta,
+# las palabras de cada intención, niveles y nombres de carrera. Si sobra cualquier otra
+# ("horas de consulta", "fechas de inscripción") la pregunta no es una consulta a la tabla.
+QUESTION_WORDS = {
+    'a', 'al', 'de', 'del', 'el', 'la', 'las', 'lo', 'los', 'en', 'y', 'e', 'o', 'u', 'un', 'una',
+    'que', 'cual', 'cuales', 'cuanto', 'cuanta', 'cuantos', 'cuantas', 'es', 'son', 'se', 'esta',
+    'estan', 'tiene', 'tienen', 'hay', 'me', 'mi', 'por', 'para', 'favor', 'hola', 'decime',
+    'sabes', 'todas', 'todos', 'materia', 'materias', 'asignatura', 'asignaturas', 'plan', 'estudio',
+    'estudios', 'carrera', 'correlativa', 'correlativas', 'correlatividad', 'correlatividades',
+    'horas', 'carga', 'horaria', 'semanal', 'semanales', 'total', 'totales', 'cursa', 'cursan',
+    'dicta', 'dictan', 'nivel', 'ano', 'cuatrimestre', 'primer', 'primero', 'segundo', 'tercer',
+    'tercero', 'cuarto', 'quinto', 'sexto', 'mecanico', 'electricista', 'isi', 'ti',
+}
+_ORDINAL_TOKEN = re.compile(r'^\d(o|ro|er|do|to)?$')
+
+
+def _clean(cell: Any) -> str:
+    return ' '.join(str(cell).split()) if cell not in (None, '') else ''
+
+
+def _plain(text: str) -> str:
+    return ' '.join(_strip_accents(text.lower()).split())
+
+
+def _tokens(text: str) -> List[str]:
+    """Tokens para comparar nombres: sin tildes ni puntuación y con 1, 2, 3... como números
+    romanos, así "Análisis Matemático 2" y "Análisis Matemático II" coinciden."""
+    return [NUMERAL_TOKENS.get(t, t) for t in re.findall(r'[a-z0-9]+', _plain(text))]
+
+
+CARRERA_WORDS = {t for name in PLAN_NAMES.values() for t in _tokens(name)}
+
+
+def subject_key(name: str) -> str:
+    """Clave de búsqueda de una materia: sin aclaraciones entre paréntesis ("(Int)", "(MEL)")."""
+    return ' '.join(_tokens(re.sub(r'\([^)]*\)|\*', ' ', name)))
+
+
+def _to_int(cell: Any) -> Optional[int]:
+    value = _clean(cell)
+    return int(value) if value.isdigit() else None
+
+
+def _column_roles(row: List[Any]) -> Dict[str, int]:
+    """Rol de cada columna según el encabezado de la tabla."""
+    roles: Dict[str, int] = {}
+    for i, cell in enumerate(row):
+        text = _plain(_clean(cell))
+        if not text:
+            continue
+        if 'correlativ' in text:
+            role = 'correlativas'
+        elif 'asignatura' in text:
+            role = 'materia'
+        elif 'regimen' in text:
+            role = 'regimen'
+        elif 'semanal' in text or 'sem.' in text:
+            role = 'horas_semanales'
+        elif 'total' in text:
+            role = 'horas_totales'
+        elif text == 'nivel':
+            role = 'nivel'
+        elif text.replace(' ', '').lstrip('.') in ('n°', 'no', 'cod'):
+            role = 'codigo'
+        else:
+            continue
+        roles.setdefault(role, i)
+    if len(roles) >= 2 and 'materia' not in roles and 'codigo' in roles:
+        # Encabezados sin "Asignatura" (Mecánica pone "PRIMER NIVEL"): es la columna que sigue al número
+        roles['materia'] = roles['codigo'] + 1
+    return roles
+
+
+def extract_subjects(chunks: List[Chunk], carrera: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Filas normalizadas (una por materia) de las tablas de un plan de estudios.
+
+    Las tablas se recorren en orden de página porque el estado se arrastra entre ellas: una
+    tabla que sigue en la página siguiente no repite el encabezado ni el "TERCER NIVEL".
+    Las correlativas vienen como códigos ("02 - 03") y se resuelven a nombres al final.
+    """
+    tables = sorted(
+        (c for c in chunks if c.chunk_type == 'table' and c.table),
+        key=lambda c: (c.page, int(str(c.metadata.get('table_id', 't_0_0')).rsplit('_', 1)[-1]))
+    )
+    subjects: List[Dict[str, Any]] = []
+    cols: Dict[str, int] = {}
+    width = 0
+    nivel = cuatrimestre = None
+    for chunk in tables:
+        for row in chunk.table:
+            roles = _column_roles(row)
+            if 'materia' in roles:
+                cols, width = roles, len(row)
+                continue
+            if not cols or len(row) != width:
+                continue
+            if 'nivel' in cols and _plain(_clean(row[cols['nivel']])) in ROMAN:
+                nivel = ROMAN[_plain(_clean(row[cols['nivel']]))]
+            heading = False
+            for cell in row:
+                m = _HEADING.match(_plain(_clean(cell)))
+                if m:
+                    heading = True
+                    if m.group(2) == 'cuatrimestre':
+                        cuatrimestre = ORDINALS[m.group(1)]
+                    else:
+                        nivel = ORDINALS[m.group(1)]
+            if heading:
+                continue
+            materia = _clean(row[cols['materia']])
+            codigo = _clean(row[cols['codigo']]) if 'codigo' in cols else ''
+            semanales = _to_int(row[cols['horas_semanales']]) if 'horas_semanales' in cols else None
+            totales = _to_int(row[cols['horas_totales']]) if 'horas_totales' in cols else None
+            if not materia or not (codigo.isdigit() or semanales is not None or totales is not None):
+                continue
+            correlativas = None
+            if 'correlativas' in cols:
+                correlativas = re.findall(r'\d+', _clean(row[cols['correlativas']]))
+            subjects.append({
+                'carrera': carrera,
+                'nivel': nivel,
+                'cuatrimestre': cuatrimestre,
+                'codigo': codigo or None,
+                'materia': materia.rstrip(' *'),
+                'materia_key': subject_key(materia),
+                'regimen': (_clean(row[cols['regimen']]) or None) if 'regimen' in cols else None,
+                'horas_semanales': semanales,
+                'horas_totales': totales,
+                'correlativas': correlativas,
+                'page': chunk.page,
+            })
+    by_code = {s['codigo']: s['materia'] for s in subjects if s['codigo']}
+    for s in subjects:
+        if s['correlativas'] is not None:
+            s['correlativas'] = [by_code.get(code, f"cód. {code}") for code in s['correlativas']]
+    return subjects
+
+
+class TableStore:
+    """Filas de los planes de estudio (carrera, nivel, materia, horas, correlativas) en SQLite.
+
+    Las tablas que pdfplumber extrae de los PDFs se guardan normalizadas, además de indexarse
+    como texto en Chroma. Con índices por clave de materia y por (carrera, nivel), las
+    preguntas que son una consulta puntual ("¿correlativas de Materiales?", "¿materias de
+    primer año de Civil?") se responden con un SELECT exacto, sin embeddings ni LLM.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS subjects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                carrera TEXT,
+                nivel INTEGER,
+                cuatrimestre INTEGER,
+                codigo TEXT,
+                materia TEXT NOT NULL,
+                materia_key TEXT NOT NULL,
+                regimen TEXT,
+                horas_semanales INTEGER,
+                horas_totales INTEGER,
+                correlativas TEXT,
+                page INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_subjects_key ON subjects(materia_key, carrera)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_subjects_level ON subjects(carrera, nivel, cuatrimestre)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_subjects_source ON subjects(source)")
+        # Hash del PDF del que salieron las filas: el indexador re-extrae sólo si no coincide
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                carrera TEXT,
+                file_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM subjects").fetchone()[0]
+
+    # --- Escritura (la llama IncrementalIndexer) ---
+    def replace_source(self, source: str, file_hash: str, chunks: List[Chunk]) -> int:
+        """Reemplaza las filas de un PDF en una sola transacción."""
+        carrera = plan_carrera(os.path.splitext(source)[0])
+        subjects = extract_subjects(chunks, carrera)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM subjects WHERE source = ?", (source,))
+            self._conn.executemany(
+                "INSERT INTO subjects (source, carrera, nivel, cuatrimestre, codigo, materia, materia_key, regimen, "
+                "horas_semanales, horas_totales, correlativas, page) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(source, carrera, s['nivel'], s['cuatrimestre'], s['codigo'], s['materia'], s['materia_key'],
+                  s['regimen'], s['horas_semanales'], s['horas_totales'],
+                  json.dumps(s['correlativas'], ensure_ascii=False) if s['correlativas'] is not None else None,
+                  s['page']) for s in subjects]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources (source, carrera, file_hash, updated_at) VALUES (?, ?, ?, ?)",
+                (source, carrera, file_hash, time.time())
+            )
+        return len(subjects)
+
+    def remove_source(self, source: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM subjects WHERE source = ?", (source,))
+            self._conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+
+    def file_hash(self, source: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT file_hash FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    # --- Consultas ---
+    def find_subjects(self, keys: List[str], carrera: Optional[str] = None) -> List[Dict[str, Any]]:
+        if not keys:
+            return []
+        sql = f"SELECT * FROM subjects WHERE materia_key IN ({','.join('?' * len(keys))})"
+        params: List[Any] = list(keys)
+        if carrera:
+            sql += " AND carrera = ?"
+            params.append(carrera)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY carrera, nivel, cuatrimestre, id", params).fetchall()
+        return [self._row(r) for r in rows]
+
+    def subjects_by_level(self, carrera: str, nivel: Optional[int] = None, cuatrimestre: Optional[int] = None) -> List[Dict[str, Any]]:
+        sql, params = "SELECT * FROM subjects WHERE carrera = ?", [carrera]
+        if nivel is not None:
+            sql += " AND nivel = ?"
+            params.append(nivel)
+        if cuatrimestre is not None:
+            sql += " AND cuatrimestre = ?"
+            params.append(cuatrimestre)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY id", params).fetchall()
+        return [self._row(r) for r in rows]
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        if record['correlativas'] is not None:
+            record['correlativas'] = json.loads(record['correlativas'])
+        return record
+
+    # --- Resolución de preguntas ---
+    def _match_subjects(self, tokens: List[str], carrera: Optional[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Materias cuyo nombre aparece completo en la pregunta. Se prueban todos los n-gramas
+        de la pregunta contra el índice y gana el nombre más largo ("Física II" sobre "Física I").
+        Devuelve también los tokens que quedan fuera del nombre, para detectar la carrera sin
+        confundirse con materias como "Ingeniería Civil I"."""
+        grams = {' '.join(tokens[i:j]): (i, j) for i in range(len(tokens))
+                 for j in range(i + 1, min(len(tokens), i + MAX_NGRAM) + 1)}
+        rows = self.find_subjects(list(grams), carrera)
+        if not rows:
+            return [], tokens
+        longest = max(len(r['materia_key']) for r in rows)
+        rows = [r for r in rows if len(r['materia_key']) == longest]
+        i, j = grams[rows[0]['materia_key']]
+        return rows, tokens[:i] + tokens[j:]
+
+    def answer(self, query: str) -> Optional[Dict[str, Any]]:
+        """Respuesta exacta para preguntas de consulta sobre los planes, o None si la pregunta
+        no es una consulta puntual (o es ambigua) y tiene que seguir por el RAG + LLM."""
+        plain = _plain(query)
+        intents = {name for name, pattern in _INTENTS if pattern.search(plain)}
+        if not intents:
+            return None
+        rows, rest = self._match_subjects(_tokens(query), None)
+        if any(t not in QUESTION_WORDS and t not in CARRERA_WORDS and t not in ROMAN and not _ORDINAL_TOKEN.match(t)
+               for t in rest):
+            return None
+        if len(mentioned_carreras(' '.join(rest))) > 1:
+            return None  # compara carreras: una respuesta exacta cubriría sólo una
+        carrera = detect_query_carrera(' '.join(rest))
+        if carrera:
+            rows = [r for r in rows if r['carrera'] == carrera]
+        intent = next((name for name in ('correlativas', 'horas', 'nivel') if name in intents), None)
+        if not rows or intent is None:
+            return self._answer_listing(plain, carrera) if 'listado' in intents else None
+        if len({r['carrera'] for r in rows}) > 1:
+            return None  # materia de varias carreras y la pregunta no dice cuál
+        if intent == 'correlativas' and any(r['correlativas'] is None for r in rows):
+            return None  # el plan no tiene columna de correlativas
+        lines = [self._format_subject(r, intent) for r in rows]
+        return {'response': "\n".join(lines) + self._sources_footer(rows), 'rows': rows, 'intent': intent}
+
+    def _answer_listing(self, plain: str, carrera: Optional[str]) -> Optional[Dict[str, Any]]:
+        m = _QUERY_LEVEL.search(plain)
+        if not carrera or not m:
+            return None
+        number = ORDINALS.get(m.group(1)) or int(m.group(1))
+        if m.group(2) == 'cuatrimestre':
+            rows, label = self.subjects_by_level(carrera, cuatrimestre=number), f"{number}° cuatrimestre"
+        else:
+            rows, label = self.subjects_by_level(carrera, nivel=number), f"{number}° año"
+        if not rows:
+            return None
+        lines = [f"Materias de {label} de {PLAN_NAMES.get(carrera, carrera)}:", ""]
+        for r in rows:
+            hours = self._format_hours(r)
+            lines.append(f"- {r['materia']}" + (f" ({hours})" if hours else ""))
+        return {'response': "\n".join(lines) + self._sources_footer(rows), 'rows': rows, 'intent': 'listado'}
+
+    @staticmethod
+    def _format_hours(r: Dict[str, Any]) -> str:
+        parts = []
+        if r['horas_semanales'] is not None:
+            parts.append(f"{r['horas_semanales']} h semanales")
+        if r['horas_totales'] is not None:
+            parts.append(f"{r['horas_totales']} h totales")
+        return ", ".join(parts)
+
+    def _format_subject(self, r: Dict[str, Any], intent: str) -> str:
+        plan = PLAN_NAMES.get(r['carrera'], r['source'])
+        where = []
+        if r['cuatrimestre'] is not None:
+            where.append(f"{r['cuatrimestre']}° cuatrimestre")
+        if r['nivel'] is not None:
+            where.append(f"{r['nivel']}° año")
+        where_text = ", ".join(where)
+        name = f"**{r['materia']}** ({plan})"
+        if intent == 'correlativas':
+            if not r['correlativas']:
+                return f"{name} no tiene correlativas."
+            return f"{name} tiene como correlativas: " + ", ".join(r['correlativas']) + "."
+        if intent == 'nivel':
+            return f"{name} se cursa en {where_text}." if where_text else f"{name}: el plan no indica el nivel."
+        hours = self._format_hours(r)
+        details = ", ".join(p for p in (where_text, r['regimen'] and r['regimen'].lower()) if p)
+        return f"{name}: {hours or 'el plan no indica la carga horaria'}" + (f" ({details})." if details else ".")
+
+    @staticmethod
+    def _sources_footer(rows: List[Dict[str, Any]]) -> str:
+        sources = sorted({(r['source'], r['page']) for r in rows})
+        return "\n\n📎 Fuente: " + "; ".join(f"{source}, pág. {page}" for source, page in sources)
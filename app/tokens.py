@@ -0,0 +1,24 @@
+from functools import lru_cache
+
+import tiktoken
+
+
+@lru_cache(maxsize=8)
+def _get_encoder(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")  # fallback
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    return len(_get_encoder(model).encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """Corta el texto a max_tokens tokens (sin partir caracteres multibyte)."""
+    encoder = _get_encoder(model)
+    tokens = encoder.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens]).rstrip()
@@ -1,12 +1,19 @@
 import os
 import re
+import time
+import unicodedata
+import threading
 import pdfplumber
-from typing import Dict, Any, Optional, List, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Dict, Any, Optional, List, Tuple, Iterator, Set
 from dataclasses import dataclass
 from collections import Counter
-from langchain.tools import tool
-from llama_index.core import Document
-from duckduckgo_search import DDGS
+
+if TYPE_CHECKING:
+    from llama_index.core import Document
+
+from web_cache import WebSearchCache
+from lexical import year_key
 
 try:
     from tavily import TavilyClient
@@ -23,6 +30,7 @@ class Chunk:
     source: str
     page: int = 0
     confidence: float = 1.0
+    table: Optional[List[List[Any]]] = None  # filas crudas de pdfplumber, para TableStore
 
 COMMON_CARRERAS = {
     'sistemas': ['sistemas', 'informática', 'informacion'],
@@ -32,6 +40,20 @@ COMMON_CARRERAS = {
     'electrica': ['eléctrica'],
 }
 
+# Carrera de cada plan según el nombre del archivo: el texto de las páginas no trae el título y
+# materias como "Sistemas de Representación" hacen que la detección por contenido marque todo
+# como 'sistemas'. Los más específicos van primero; las variantes sin vocales cubren los
+# nombres de archivo que perdieron las tildes ("Mecnica", "Energa-Elctrica").
+PLAN_CARRERAS: List[Tuple[str, List[str]]] = [
+    ('mecatronica', ['mecatronica']),
+    ('tecnologias_informacion', ['tecnologias de la informacion', 'tecnicatura en tecnologias']),
+    ('sistemas', ['sistemas', 'informacin']),
+    ('industrial', ['industrial']),
+    ('civil', ['civil']),
+    ('mecanica', ['mecanica', 'mecnica']),
+    ('electrica', ['electrica', 'elctrica']),
+]
+
 import logging
 
 logging.basicConfig(
@@ -44,78 +66,278 @@ logging.basicConfig(
 # --- DETECTOR DE PATRONES ACADÉMICOS ---
 class AcademicPatternDetector:
     def __init__(self):
+        # Los planes de ingeniería dicen "PRIMER NIVEL", las tecnicaturas "PRIMER AÑO"
         self.year_patterns = [
-            (re.compile(r'\b(1°|PRIMER)\s+AÑO\b', re.IGNORECASE), 1),
-            (re.compile(r'\b(2°|SEGUNDO)\s+AÑO\b', re.IGNORECASE), 2),
-            (re.compile(r'\bTERCER\s+AÑO\b', re.IGNORECASE), 3),
-            (re.compile(r'\bCUARTO\s+AÑO\b', re.IGNORECASE), 4),
-            (re.compile(r'\bQUINTO\s+AÑO\b', re.IGNORECASE), 5),
+            (re.compile(r'\b(1°|PRIMER)\s+(AÑO|NIVEL)\b', re.IGNORECASE), 1),
+            (re.compile(r'\b(2°|SEGUNDO)\s+(AÑO|NIVEL)\b', re.IGNORECASE), 2),
+            (re.compile(r'\b(3°|TERCER)\s+(AÑO|NIVEL)\b', re.IGNORECASE), 3),
+            (re.compile(r'\b(4°|CUARTO)\s+(AÑO|NIVEL)\b', re.IGNORECASE), 4),
+            (re.compile(r'\b(5°|QUINTO)\s+(AÑO|NIVEL)\b', re.IGNORECASE), 5),
+            (re.compile(r'\b(6°|SEXTO)\s+(AÑO|NIVEL)\b', re.IGNORECASE), 6),
         ]
+        # De la más específica a la más general: gana la primera que aparece en el chunk
         self.section_patterns = {
             'correlativas': re.compile(r'\bCORRELATIVAS\b', re.IGNORECASE),
-            'materias': re.compile(r'MATERIAS\s+(OBLIGATORIAS|ELECTIVAS)?', re.IGNORECASE),
-            'plan_estudios': re.compile(r'\bPLAN DE ESTUDIOS\b', re.IGNORECASE),
+            'materias': re.compile(r'\b(MATERIAS|ASIGNATURAS?)\b', re.IGNORECASE),
+            'plan_estudios': re.compile(r'\bPLAN DE ESTUDIOS?\b', re.IGNORECASE),
         }
 
     def enrich_chunk_metadata(self, chunk: Chunk) -> Chunk:
+        """Marca los años que aparecen en el chunk (una página suele tener dos niveles, por eso
+        es una bandera por año: año_1, año_2...) y el tipo de contenido."""
         text = chunk.content.upper()
         for pattern, año in self.year_patterns:
             if pattern.search(text):
-                chunk.metadata['año'] = año
+                chunk.metadata[year_key(año)] = True
                 chunk.metadata['seccion_padre'] = pattern.pattern
         for tipo, pattern in self.section_patterns.items():
             if pattern.search(text):
                 chunk.metadata['tipo_contenido'] = tipo
+                break
         return chunk
 
+# --- ANÁLISIS DE CONSULTAS ---
+def _strip_accents(text: str) -> str:
+    return ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+
+def plan_carrera(text: str) -> Optional[str]:
+    """Carrera de un plan a partir del nombre de su archivo."""
+    plain = _strip_accents(text.lower().replace('-', ' ').replace('_', ' '))
+    for carrera, keywords in PLAN_CARRERAS:
+        if any(k in plain for k in keywords):
+            return carrera
+    return None
+
+# Mismo vocabulario que PLAN_CARRERAS, sobre la pregunta sin tildes. Los lookaheads descartan
+# nombres de materias que contienen la palabra de una carrera ("Sistemas de Representación",
+# "Ingeniería Civil I", "Mecánica Racional", "Integración Eléctrica II").
+QUERY_CARRERAS = {
+    'mecatronica': r'mecatronica',
+    'tecnologias_informacion': r'tecnologias de la informacion|tecnicatura en (tecnologias|ti)\b',
+    'sistemas': r'sistemas de informacion|isi|sistemas(?!\s+(de|y|operativos|digitales)\b)',
+    'industrial': r'industrial',
+    'civil': r'civil(?!\s+(i|ii|iii|1|2|3)\b)',
+    'mecanica': r'mecanic[ao](?!\s+(i|ii|iii|1|2|3|racional|tecnica|de|y)\b)',
+    'electrica': r'electrica(?!\s+(i|ii|1|2)\b)|electricista',
+}
+_QUERY_CARRERA_PATTERN = re.compile(
+    '|'.join(f'(?P<{carrera}>\\b(?:{pattern})\\b)' for carrera, pattern in QUERY_CARRERAS.items())
+)
+# Palabras que introducen el nombre de una carrera: "en Civil", "de Sistemas", "Ingeniería Industrial"
+_CARRERA_CUE = re.compile(r'\b(en|de|ingenieria|carrera|tecnicatura|superior)\s+$')
+
+
+def detect_query_carrera(text: str) -> Optional[str]:
+    """Carrera mencionada en la pregunta. Si aparece más de una palabra de carrera se
+    prefieren las introducidas por "en"/"de"/"Ingeniería" y, entre ellas, la última: en
+    "Mantenimiento Industrial en Mecatrónica" la carrera es Mecatrónica."""
+    plain = _strip_accents(text.lower())
+    matches = [(m.start(), m.lastgroup) for m in _QUERY_CARRERA_PATTERN.finditer(plain)]
+    if not matches:
+        return None
+    cued = [carrera for start, carrera in matches if _CARRERA_CUE.search(plain[:start])]
+    return (cued or [carrera for _, carrera in matches])[-1]
+
+def mentioned_carreras(text: str) -> Set[str]:
+    """Todas las carreras que nombra el texto, sin desempatar entre ellas."""
+    return {m.lastgroup for m in _QUERY_CARRERA_PATTERN.finditer(_strip_accents(text.lower()))}
+
+class QueryAnalyzer:
+    """Detecta en la pregunta la carrera, el año y la sección buscada, con el mismo vocabulario
+    de metadata que usan GenericPDFProcessor._apply_carrera y AcademicPatternDetector."""
+
+    def __init__(self):
+        self.year_patterns = [
+            (re.compile(r'\b(1(°|º|ro|er)?|primer|primero)\s+(año|nivel)\b'), 1),
+            (re.compile(r'\b(2(°|º|do)?|segundo)\s+(año|nivel)\b'), 2),
+            (re.compile(r'\b(3(°|º|ro|er)?|tercer|tercero)\s+(año|nivel)\b'), 3),
+            (re.compile(r'\b(4(°|º|to)?|cuarto)\s+(año|nivel)\b'), 4),
+            (re.compile(r'\b(5(°|º|to)?|quinto)\s+(año|nivel)\b'), 5),
+            (re.compile(r'\b(6(°|º|to)?|sexto)\s+(año|nivel)\b'), 6),
+        ]
+        self.section_patterns = {
+            'correlativas': re.compile(r'\bcorrelativ'),
+            'plan_estudios': re.compile(r'\bplan(es)? de estudios?\b'),
+            'materias': re.compile(r'\b(materias|asignaturas)\b'),
+        }
+
+    def analyze(self, query: str) -> Dict[str, Any]:
+        text = query.lower()
+        plain = _strip_accents(text)
+        filters: Dict[str, Any] = {}
+        carrera = detect_query_carrera(text)
+        if carrera:
+            filters['carrera'] = carrera
+        for pattern, año in self.year_patterns:
+            if pattern.search(text):
+                filters['año'] = año
+                break
+        for tipo, pattern in self.section_patterns.items():
+            if pattern.search(plain):
+                filters['tipo_contenido'] = tipo
+                break
+        return filters
+
+    @staticmethod
+    def to_where(filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Convierte los filtros al formato 'where' de Chroma. El año se guarda como una
+        bandera por año (año_1, año_2...), porque un chunk puede abarcar dos niveles."""
+        if not filters:
+            return None
+        clauses = [{year_key(v): True} if k == 'año' else {k: v} for k, v in filters.items()]
+        if len(clauses) == 1:
+            return clauses[0]
+        return {'$and': clauses}
+
+    @staticmethod
+    def relaxations(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Filtros de más a menos estrictos: se sueltan primero la sección y el año, después
+        la carrera, y al final se busca sin filtros."""
+        steps = [dict(filters)]
+        for key in ('tipo_contenido', 'año', 'carrera'):
+            if key in steps[-1]:
+                relaxed = {k: v for k, v in steps[-1].items() if k != key}
+                steps.append(relaxed)
+        if steps[-1]:
+            steps.append({})
+        return steps
+
 # --- PROCESADOR DE PDF ---
+HEAD_PAGES = 3  # páginas iniciales usadas para detectar la carrera
+
+
+def _process_page_range(args: Tuple[str, int, Optional[int], int, int]) -> Tuple[List[Chunk], List[str], int, float, float]:
+    """Worker del pool de procesos: procesa un rango de páginas de un PDF.
+    Está a nivel de módulo para que pueda serializarse hacia los procesos hijos.
+    Devuelve también el inicio y el fin (time.time, comparable entre procesos) para
+    medir el tiempo de pared de cada archivo."""
+    path, start, end, chunk_size, chunk_overlap = args
+    started = time.time()
+    processor = GenericPDFProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap, workers=1)
+    chunks, head_texts, pages = processor._extract_page_range(path, start, end)
+    return chunks, head_texts, pages, started, time.time()
+
+
 class GenericPDFProcessor:
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50):
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, workers: Optional[int] = None, pages_per_task: int = 8):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.workers = workers if workers is not None else int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+        self.pages_per_task = max(pages_per_task, HEAD_PAGES)
+        self.detector = AcademicPatternDetector()
         self.chunks: List[Chunk] = []
         self.document_patterns: Dict[str, Any] = {}
+        self.file_timings: Dict[str, Dict[str, float]] = {}
 
-    def process_folder(self, folder_path: str = "data") -> List[Chunk]:
+    def process_folder(self, folder_path: str = "data", workers: Optional[int] = None) -> List[Chunk]:
         if not os.path.exists(folder_path):
             logging.warning(f"Carpeta no existe: {folder_path}")
             return []
-        pdfs = [f for f in os.listdir(folder_path) if f.lower().endswith('.pdf')]
+        pdfs = sorted(f for f in os.listdir(folder_path) if f.lower().endswith('.pdf'))
         if not pdfs:
             logging.warning(f"No se encontraron PDFs en: {folder_path}")
             return []
-        all_chunks = []
-        for f in pdfs:
-            path = os.path.join(folder_path, f)
-            logging.info(f"Procesando PDF: {path}")
-            c = self.process_pdf(path)
-            logging.info(f"Se extrajeron {len(c)} chunks del PDF {f}")
-            all_chunks.extend(c)
-        self._analyze_document_patterns(all_chunks)
+        all_chunks = self.process_files([os.path.join(folder_path, f) for f in pdfs], workers=workers)
+        if all_chunks:
+            self._analyze_document_patterns(all_chunks)
         self.chunks = all_chunks
         return all_chunks
 
+    def process_files(self, paths: List[str], workers: Optional[int] = None) -> List[Chunk]:
+        """Procesa varios PDFs. Con más de un worker reparte archivos y rangos de páginas
+        en un pool de procesos; el resultado mantiene el orden (archivo, página) de la versión serial."""
+        workers = self.workers if workers is None else workers
+        if workers <= 1 or not paths:
+            all_chunks = []
+            for path in paths:
+                c = self.process_pdf(path)
+                logging.info(f"Se extrajeron {len(c)} chunks del PDF {os.path.basename(path)}")
+                all_chunks.extend(c)
+            return all_chunks
+
+        tasks = []
+        for path in paths:
+            try:
+                with pdfplumber.open(path) as pdf:
+                    n_pages = len(pdf.pages)
+            except Exception as e:
+                logging.error(f"Error en {path}: {e}")
+                continue
+            for start in range(0, n_pages, self.pages_per_task):
+                tasks.append((path, start, min(start + self.pages_per_task, n_pages), self.chunk_size, self.chunk_overlap))
+
+        results: Dict[Tuple[str, int], Tuple[List[Chunk], List[str], int, float, float]] = {}
+        wall_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks) or 1)) as pool:
+            futures = {pool.submit(_process_page_range, task): task for task in tasks}
+            for future in as_completed(futures):
+                path, start = futures[future][:2]
+                try:
+                    results[(path, start)] = future.result()
+                except Exception as e:
+                    logging.error(f"Error en {path} (páginas {start + 1}+): {e}")
+
+        all_chunks = []
+        for path in paths:
+            starts = sorted(start for (p, start) in results if p == path)
+            if not starts:
+                continue
+            file_chunks, head_texts, pages, spans = [], [], 0, []
+            for start in starts:
+                chunks, head, task_pages, started, finished = results[(path, start)]
+                file_chunks += chunks
+                head_texts += head
+                pages += task_pages
+                spans.append((started, finished))
+            self._apply_carrera(file_chunks, head_texts, path)
+            # Igual que en process_pdf: páginas recorridas y tiempo de pared del archivo
+            seconds = max(f for _, f in spans) - min(s for s, _ in spans)
+            self.file_timings[path] = {'pages': pages, 'chunks': len(file_chunks), 'seconds': seconds}
+            logging.info(f"Se extrajeron {len(file_chunks)} chunks del PDF {os.path.basename(path)} en {seconds:.2f}s")
+            all_chunks.extend(file_chunks)
+        logging.info(f"Ingesta paralela ({workers} workers): {len(paths)} PDFs en {time.perf_counter() - wall_start:.2f}s")
+        return all_chunks
+
     def process_pdf(self, path: str) -> List[Chunk]:
-        chunks = []
-        detector = AcademicPatternDetector()
+        chunks, pages = [], 0
+        t0 = time.perf_counter()
+        logging.info(f"Procesando PDF: {path}")
         try:
-            with pdfplumber.open(path) as pdf:
-                carrera = self.detect_carrera(''.join([p.extract_text() or '' for p in pdf.pages[:3]]))
-                logging.info(f"Detectada carrera: {carrera} en archivo {os.path.basename(path)}")
-                for i, page in enumerate(pdf.pages):
-                    logging.info(f"Procesando página {i+1} de {os.path.basename(path)}")
-                    chunks += self._extract_tables(page, path, i+1, carrera)
-                    text = page.extract_text()
-                    if text:
-                        for c in self._process_text(text, path, i+1):
-                            if carrera:
-                                c.metadata['carrera'] = carrera
-                            chunks.append(detector.enrich_chunk_metadata(c))
+            chunks, head_texts, pages = self._extract_page_range(path)
+            self._apply_carrera(chunks, head_texts, path)
             logging.info(f"Chunks totales extraídos: {len(chunks)} del archivo {os.path.basename(path)}")
         except Exception as e:
             logging.error(f"Error en {path}: {e}")
+        self.file_timings[path] = {'pages': pages, 'chunks': len(chunks), 'seconds': time.perf_counter() - t0}
         return chunks
 
+    def _extract_page_range(self, path: str, start: int = 0, end: Optional[int] = None) -> Tuple[List[Chunk], List[str], int]:
+        """Extrae tablas y texto de las páginas [start, end). El texto de cada página se extrae una
+        sola vez; el de las primeras páginas se devuelve para detectar la carrera sin re-extraerlo.
+        También devuelve cuántas páginas recorrió, tengan o no chunks."""
+        chunks, head_texts = [], []
+        with pdfplumber.open(path) as pdf:
+            pages = pdf.pages[start:end]
+            for num, page in enumerate(pages, start=start + 1):
+                logging.info(f"Procesando página {num} de {os.path.basename(path)}")
+                text = page.extract_text()
+                if num <= HEAD_PAGES:
+                    head_texts.append(text or '')
+                chunks += self._extract_tables(page, path, num)
+                if text:
+                    for c in self._process_text(text, path, num):
+                        chunks.append(self.detector.enrich_chunk_metadata(c))
+        return chunks, head_texts, len(pages)
+
+    def _apply_carrera(self, chunks: List[Chunk], head_texts: List[str], path: str) -> Optional[str]:
+        # El nombre del archivo identifica el plan; el texto sólo se usa para PDFs con otro nombre
+        carrera = plan_carrera(os.path.splitext(os.path.basename(path))[0]) or self.detect_carrera(''.join(head_texts))
+        logging.info(f"Detectada carrera: {carrera} en archivo {os.path.basename(path)}")
+        if carrera:
+            for c in chunks:
+                c.metadata['carrera'] = carrera
+        return carrera
+
     def _extract_tables(self, page, src: str, num: int, carrera=None) -> List[Chunk]:
         chunks = []
         try:
@@ -128,7 +350,7 @@ class GenericPDFProcessor:
                     'has_headers': self._detect_table_headers(t)
                 }
                 if carrera: meta['carrera'] = carrera
-                chunks.append(Chunk(txt, 'table', meta, src, num))
+                chunks.append(self.detector.enrich_chunk_metadata(Chunk(txt, 'table', meta, src, num, table=t)))
         except Exception as e:
             print(f"⚠️ Tabla pág {num}: {e}")
         return chunks
@@ -216,19 +438,43 @@ class GenericPDFProcessor:
         return None
 
 # --- WRAPPER DE HERRAMIENTAS ---
+TAVILY_DOMAINS = ['frsf.utn.edu.ar', 'ceut-frsf.com.ar', 'utn.edu.ar/es/', 'sysacad.frsf.utn.edu.ar/']
+DDG_SITE_FILTER = "(site:frsf.utn.edu.ar OR site:ceut-frsf.com.ar OR 'utn.edu.ar/es/' OR 'sysacad.frsf.utn.edu.ar/')"
+
 class Tools:
-    def __init__(self, tavily_api_key: Optional[str] = None):
+    def __init__(self, tavily_api_key: Optional[str] = None, web_cache: Optional[WebSearchCache] = None, use_web_cache: bool = True):
         self.pdf_processor = GenericPDFProcessor(chunk_size=800, chunk_overlap=100)
         self.tavily_client = TavilyClient(api_key=tavily_api_key) if TAVILY_AVAILABLE and tavily_api_key else None
+        self.web_cache = web_cache or (WebSearchCache() if use_web_cache else None)
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="web-refresh")
+        self._refresh_lock = threading.Lock()
+        self._refreshing = set()
 
-    def load_pdfs_from_folder(self, folder_path: str = "data") -> List[Document]:
+    def load_pdfs_from_folder(self, folder_path: str = "data") -> List["Document"]:
         """Carga todos los archivos PDF desde una carpeta 
         y los convierte en objetos Document para RAG con metadatos útiles."""
         chunks = self.pdf_processor.process_folder(folder_path)
-        documentos = [Document(text=c.content, metadata=c.metadata) for c in chunks]
+        documentos = [self._to_document(c) for c in chunks]
         logging.info(f"[Tools] 📄 PDFs procesados: {len(documentos)} documentos cargados desde '{folder_path}'")
         return documentos
 
+    def iter_pdfs_from_folder(self, folder_path: str = "data") -> Iterator["Document"]:
+        """Versión perezosa de load_pdfs_from_folder: procesa un PDF por vez y va entregando
+        sus chunks, para indexar en streaming sin tener el corpus entero en memoria."""
+        if not os.path.isdir(folder_path):
+            logging.warning(f"Carpeta no existe: {folder_path}")
+            return
+        for f in sorted(f for f in os.listdir(folder_path) if f.lower().endswith('.pdf')):
+            for c in self.pdf_processor.process_pdf(os.path.join(folder_path, f)):
+                yield self._to_document(c)
+
+    @staticmethod
+    def _to_document(c: Chunk) -> "Document":
+        """Document con la misma metadata que guarda IncrementalIndexer (archivo, página y tipo)."""
+        from llama_index.core import Document
+        return Document(text=c.content, metadata={**c.metadata, 'source': os.path.basename(c.source),
+                                                   'page': c.page, 'chunk_type': c.chunk_type})
+
     def search_web(self, query: str, max_results: int = 3, prefer_tavily: bool = True) -> dict:
         """Realiza una búsqueda web utilizando Tavily o DuckDuckGo y devuelve los resultados relevantes."""
         strategies = []
@@ -245,12 +491,55 @@ class Tools:
         return {'query': query, 'results': [], 'error': 'No resultados', 'source': 'Ninguno'}
 
     def search_web_tavily(self, query: str, max_results: int) -> dict:
+        return self._cached_search('tavily', query, max_results, ','.join(TAVILY_DOMAINS), self._fetch_tavily)
+
+    def search_web_duckduckgo(self, query: str, max_results: int) -> dict:
+        return self._cached_search('duckduckgo', query, max_results, DDG_SITE_FILTER, self._fetch_duckduckgo)
+
+    def _cached_search(self, provider: str, query: str, max_results: int, domains: str, fetch) -> dict:
+        """Consulta el cache persistente antes de salir a la red.
+        Fresco: se devuelve tal cual. Vencido dentro de la ventana: se devuelve y se refresca en
+        segundo plano. Sin entrada o muy viejo: se busca en vivo, y si la búsqueda falla
+        (p. ej. rate limit de DuckDuckGo) se usa lo que haya en cache."""
+        if not self.web_cache:
+            return fetch(query, max_results)
+        key = self.web_cache.make_key(provider, query, domains, max_results)
+        cached, state = self.web_cache.get(key, provider)
+        if state == 'fresh':
+            return cached
+        if state == 'stale':
+            self._refresh_in_background(key, provider, query, max_results, fetch)
+            return cached
+        result = fetch(query, max_results)
+        if result.get('results'):
+            self.web_cache.set(key, provider, query, result)
+            return result
+        return cached if cached else result
+
+    def _refresh_in_background(self, key: str, provider: str, query: str, max_results: int, fetch):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                result = fetch(query, max_results)
+                if result.get('results'):
+                    self.web_cache.set(key, provider, query, result)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_executor.submit(refresh)
+
+    def _fetch_tavily(self, query: str, max_results: int) -> dict:
         try:
             response = self.tavily_client.search(
                 query=query, 
                 max_results=max_results, 
                 search_depth="advanced", 
-                include_domains=['frsf.utn.edu.ar', 'ceut-frsf.com.ar', 'utn.edu.ar/es/', 'sysacad.frsf.utn.edu.ar/']
+                include_domains=TAVILY_DOMAINS
             )
             return {
                 'query': query,
@@ -261,10 +550,11 @@ class Tools:
         except Exception as e:
             return {'error': f'Error Tavily: {e}'}
 
-    def search_web_duckduckgo(self, query: str, max_results: int) -> dict:
+    def _fetch_duckduckgo(self, query: str, max_results: int) -> dict:
         try:
+            from duckduckgo_search import DDGS
             with DDGS() as ddgs:
-                search_query = f"{query} (site:frsf.utn.edu.ar OR site:ceut-frsf.com.ar OR 'utn.edu.ar/es/' OR 'sysacad.frsf.utn.edu.ar/')"
+                search_query = f"{query} {DDG_SITE_FILTER}"
                 results = ddgs.text(
                     search_query, 
                     max_results=max_results, 
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+TRACE_FILE = os.getenv("RAG_TRACE_FILE", "logs/traces.jsonl")
+TRACING_ENABLED = os.getenv("RAG_TRACING", "on").lower() != "off"
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+_sink_lock = threading.Lock()
+_otel_tracer = None
+_otel_checked = False
+
+
+def _get_otel_tracer():
+    """Tracer de OpenTelemetry, sólo si se configuró un endpoint OTLP (OTEL_EXPORTER_OTLP_ENDPOINT)
+    o RAG_OTEL=1. Si el SDK no está disponible se sigue sólo con el sink JSONL."""
+    global _otel_tracer, _otel_checked
+    if _otel_checked:
+        return _otel_tracer
+    _otel_checked = True
+    if not (os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") or os.getenv("RAG_OTEL", "0") == "1"):
+        return None
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+        provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "ceut-bot")}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        otel_trace.set_tracer_provider(provider)
+        _otel_tracer = otel_trace.get_tracer("ceut-bot")
+    except Exception as e:
+        logging.warning(f"⚠️ [Tracing] No se pudo inicializar OpenTelemetry ({e}), sólo se usa {TRACE_FILE}")
+    return _otel_tracer
+
+
+class Trace:
+    """Spans de una consulta: nombre, inicio relativo, duración y atributos.
+
+    Los spans pueden venir de otros hilos (recuperación local y web en paralelo), por eso
+    la lista se protege con un lock. timings() agrupa por nombre en milisegundos.
+    """
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._otel_root = None
+        tracer = _get_otel_tracer()
+        if tracer:
+            # Los spans hijos se cuelgan explícitamente de la raíz, sin depender del contexto
+            # actual, porque la traza puede cerrarse en otro punto (el final de un stream)
+            from opentelemetry.trace import set_span_in_context
+            self._otel_root = tracer.start_span(name, attributes=_otel_attributes(attributes))
+            self._otel_context = set_span_in_context(self._otel_root)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """Mide un tramo. Los atributos se pueden completar dentro del bloque (attrs['cached'] = True)."""
+        otel_span = _get_otel_tracer().start_span(name, context=self._otel_context) if self._otel_root else None
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            end = time.perf_counter()
+            record = {"name": name, "start_ms": round((start - self._t0) * 1000, 3),
+                      "duration_ms": round((end - start) * 1000, 3), "thread": threading.current_thread().name}
+            if attributes:
+                record["attributes"] = attributes
+            if error:
+                record["error"] = error
+            with self._lock:
+                self.spans.append(record)
+            if otel_span is not None:
+                otel_span.set_attributes(_otel_attributes(attributes))
+                otel_span.end()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def timings(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for record in self.spans:
+                totals[record["name"]] = round(totals.get(record["name"], 0.0) + record["duration_ms"], 3)
+        return totals
+
+    def finish(self):
+        if self.duration is not None:
+            return
+        self.duration = self.elapsed()
+        if self._otel_root is not None:
+            self._otel_root.end()
+        if TRACING_ENABLED:
+            _write_trace(self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda r: r["start_ms"])
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.started_at,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "attributes": self.attributes,
+            "spans": spans,
+        }
+
+
+def _otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in attributes.items()}
+
+
+def _write_trace(record: Dict[str, Any]):
+    try:
+        os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with _sink_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except Exception as e:
+        logging.warning(f"⚠️ [Tracing] No se pudo escribir la traza: {e}")
+
+
+def start_trace(name: str, **attributes) -> Trace:
+    """Crea una traza. Se activa con use_trace() en cada tramo que la use y se cierra con
+    finish(), que puede llegar más tarde (p. ej. cuando termina un stream)."""
+    return Trace(name, **attributes)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Deja la traza como actual mientras dura el bloque; span() la usa implícitamente."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """Span en la traza actual; si no hay ninguna activa no mide nada."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield attributes
+        return
+    with trace.span(name, **attributes) as attrs:
+        yield attrs
+
+
+def bind(fn: Callable) -> Callable:
+    """Envuelve fn para que corra con el contexto actual (traza incluida) en otro hilo."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
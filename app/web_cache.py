@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+from cache import normalize_query
+
+# TTL por proveedor (segundos): los sitios de la facultad cambian poco
+DEFAULT_TTLS = {
+    "tavily": 24 * 3600,
+    "duckduckgo": 12 * 3600,
+}
+
+
+class WebSearchCache:
+    """Cache persistente (SQLite) de resultados de búsqueda web.
+
+    La clave es (proveedor, consulta normalizada, filtro de dominios, max_results). Una entrada
+    pasa por tres estados: 'fresh' (dentro del TTL), 'stale' (vencida pero dentro de la ventana
+    stale-while-revalidate: se sirve y se refresca en segundo plano) y 'expired' (sólo se usa
+    si la búsqueda en vivo falla). El tamaño se acota desalojando las entradas menos usadas.
+    """
+
+    def __init__(self, path: str = "./data/web_cache.db", ttls: Optional[Dict[str, float]] = None,
+                 stale_window: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stale_window = stale_window
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS web_cache (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_web_cache_last_access ON web_cache(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(provider: str, query: str, domains: str, max_results: int) -> str:
+        raw = f"{provider}\x00{normalize_query(query)}\x00{domains}\x00{max_results}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, provider: str) -> Tuple[Optional[dict], Optional[str]]:
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created_at FROM web_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            now = time.time()
+            self._conn.execute("UPDATE web_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        payload, created_at = json.loads(row[0]), row[1]
+        age = now - created_at
+        ttl = self.ttls.get(provider, min(self.ttls.values()))
+        if age < ttl:
+            return payload, "fresh"
+        if age < ttl + self.stale_window:
+            return payload, "stale"
+        return payload, "expired"
+
+    def set(self, key: str, provider: str, query: str, payload: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO web_cache (key, provider, query, payload, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, normalize_query(query), json.dumps(payload, ensure_ascii=False), now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM web_cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM web_cache WHERE key IN (SELECT key FROM web_cache ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM web_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT provider, COUNT(*) FROM web_cache GROUP BY provider").fetchall()
+        return dict(rows)
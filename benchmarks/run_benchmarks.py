@@ -0,0 +1,325 @@
+"""Benchmarks de ingesta, recuperación y respuesta de punta a punta.
+
+Corre offline sobre los PDFs de data/: Gemini y los buscadores web se reemplazan por stubs
+con latencia configurable, y la colección se arma en un directorio temporal, así que no
+toca data/chroma_db. El resultado queda en un JSON para comparar entre corridas.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --repeat 5 --llm-latency 0.8 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Pico de memoria residente del proceso y de sus hijos (el pool de ingesta), en MB."""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes en macOS, KB en Linux
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    import numpy as np
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def is_relevant(result: Dict, question: Dict) -> bool:
+    """Un resultado es relevante si viene de uno de los PDFs esperados y contiene todos los términos esperados."""
+    if result.get("source") not in question["expected_sources"]:
+        return False
+    text = _normalize(result.get("document", ""))
+    return all(_normalize(term) in text for term in question.get("expected_terms", []))
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubModel:
+    """Reemplazo de genai.GenerativeModel: espera `latency` segundos y devuelve un texto fijo."""
+
+    def __init__(self, latency: float = 0.0, chunks: int = 8):
+        self.latency = latency
+        self.chunks = chunks
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        text = f"Respuesta de prueba ({len(prompt)} caracteres de prompt)."
+        if not stream:
+            time.sleep(self.latency)
+            return StubResponse(text)
+
+        def chunks():
+            for _ in range(self.chunks):
+                time.sleep(self.latency / self.chunks)
+                yield StubResponse(text[:len(text) // self.chunks])
+        return chunks()
+
+
+def make_stub_tools(latency: float):
+    from tools import Tools
+
+    class StubTools(Tools):
+        """Tools real (procesador de PDFs incluido) pero con las búsquedas web simuladas y sin cache."""
+
+        def _fetch_stub(self, query: str, max_results: int) -> dict:
+            time.sleep(latency)
+            results = [{"title": f"Resultado {i + 1}", "url": f"https://frsf.utn.edu.ar/stub/{i + 1}",
+                        "snippet": f"Contenido simulado para: {query}", "score": 1.0} for i in range(max_results)]
+            return {"query": query, "results": results, "source": "Stub", "total_results": len(results)}
+
+        _fetch_tavily = _fetch_stub
+        _fetch_duckduckgo = _fetch_stub
+
+    return StubTools(use_web_cache=False)
+
+
+def bench_ingestion(tools, data_dir: str, workers: Optional[int]) -> Dict:
+    processor = tools.pdf_processor
+    processor.file_timings.clear()
+    start = time.perf_counter()
+    chunks = processor.process_folder(data_dir, workers=workers)
+    seconds = time.perf_counter() - start
+    pages = sum(t["pages"] for t in processor.file_timings.values())
+    return {
+        "chunks": chunks,
+        "report": {
+            "files": len(processor.file_timings),
+            "pages": pages,
+            "chunks": len(chunks),
+            "workers": processor.workers if workers is None else workers,
+            "seconds": round(seconds, 3),
+            "pages_per_sec": round(pages / seconds, 2) if seconds else None,
+            "chunks_per_sec": round(len(chunks) / seconds, 2) if seconds else None,
+        },
+    }
+
+
+def bench_embeddings(rag, texts: List[str], batch_size: int) -> Dict:
+    rag.model.encode(texts[:batch_size], batch_size=batch_size)  # calentamiento
+    start = time.perf_counter()
+    rag.model.encode(texts, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+    return {
+        "backend": getattr(rag.model, "name", type(rag.model).__name__),
+        "texts": len(texts),
+        "batch_size": batch_size,
+        "seconds": round(seconds, 3),
+        "embeddings_per_sec": round(len(texts) / seconds, 2) if seconds else None,
+    }
+
+
+def bench_concurrent_encode(rag, questions: List[Dict], threads: int, rounds: int) -> Dict:
+    """Consultas concurrentes al encoder: una pasada por consulta vs. el micro-batching de RAG."""
+    texts = [f"{q['question']} ({i})" for i in range(rounds) for q in questions]  # únicas: sin aciertos de cache
+
+    def throughput(fn) -> float:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(fn, texts))
+        return len(texts) / (time.perf_counter() - start)
+
+    direct = throughput(lambda text: rag.model.encode([text])[0])
+    report = {"threads": threads, "queries": len(texts), "direct_qps": round(direct, 2)}
+    if rag.query_encoder is not None:
+        batched = throughput(rag.query_encoder.encode_one)
+        report.update({"batched_qps": round(batched, 2), "speedup": round(batched / direct, 2),
+                       "encoder": rag.query_encoder.stats()})
+    return report
+
+
+def bench_indexing(rag, chunks, batch_size: int) -> Dict:
+    """Escritura en Chroma + BM25 por el mismo camino que usa IncrementalIndexer (ids estables)."""
+    from indexer import chunk_id
+
+    ids, texts, metadatas, seen = [], [], [], {}
+    for c in chunks:
+        name = os.path.basename(c.source)
+        occurrence = seen.get((name, c.chunk_type, c.content), 0)
+        seen[(name, c.chunk_type, c.content)] = occurrence + 1
+        ids.append(chunk_id(name, c, occurrence))
+        texts.append(c.content)
+        metadatas.append({**c.metadata, "source": name, "page": c.page, "chunk_type": c.chunk_type})
+    start = time.perf_counter()
+    ok = rag.upsert_chunks(ids, texts, metadatas, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+    return {
+        "ok": ok,
+        "chunks": len(ids),
+        "seconds": round(seconds, 3),
+        "chunks_per_sec": round(len(ids) / seconds, 2) if seconds else None,
+    }
+
+
+def _reset_caches(rag):
+    rag.query_embedding_cache.clear()
+    rag.search_cache.clear()
+    if rag.reranker is not None:
+        rag.reranker.score_cache.clear()
+
+
+def bench_search(rag, questions: List[Dict], top_k: int, repeat: int, warm: bool) -> Dict:
+    latencies = []
+    for _ in range(repeat):
+        for q in questions:
+            if not warm:
+                _reset_caches(rag)
+            start = time.perf_counter()
+            rag.search(q["question"], top_k=top_k)
+            latencies.append(time.perf_counter() - start)
+
+    # Recall: una sola pasada con caches limpios, sobre el top_k que ve el agente
+    hits, source_hits, misses = 0, 0, []
+    for q in questions:
+        _reset_caches(rag)
+        results = rag.search(q["question"], top_k=top_k)
+        if any(is_relevant(r, q) for r in results):
+            hits += 1
+        else:
+            misses.append(q["question"])
+        if any(r.get("source") in q["expected_sources"] for r in results):
+            source_hits += 1
+    return {
+        "top_k": top_k,
+        "cache": "warm" if warm else "cold",
+        "latency": percentiles(latencies),
+        f"recall@{top_k}": round(hits / len(questions), 3) if questions else None,
+        f"source_recall@{top_k}": round(source_hits / len(questions), 3) if questions else None,
+        "misses": misses,
+    }
+
+
+def bench_end_to_end(rag, questions: List[Dict], repeat: int, llm_latency: float, warm: bool) -> Dict:
+    from agent import Agent
+
+    rag.answer_cache = None  # cada consulta tiene que llegar al LLM (stub)
+    agent = Agent(rag_system=rag, tools=None, memory=None, model=StubModel(latency=llm_latency))
+    latencies, stages = [], {}
+    for _ in range(repeat):
+        for q in questions:
+            if not warm:
+                _reset_caches(rag)
+            start = time.perf_counter()
+            result = agent.generate_response(q["question"])
+            latencies.append(time.perf_counter() - start)
+            for stage, ms in result.get("timings", {}).items():
+                stages.setdefault(stage, []).append(ms / 1000)
+    return {
+        "llm_latency_s": llm_latency,
+        "cache": "warm" if warm else "cold",
+        "latency": percentiles(latencies),
+        "stages": {stage: percentiles(samples) for stage, samples in sorted(stages.items())},
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Benchmarks offline de ingesta, búsqueda y respuesta")
+    parser.add_argument("--data", default=os.path.join(ROOT, "data"), help="carpeta con los PDFs")
+    parser.add_argument("--questions", default=os.path.join(ROOT, "benchmarks", "questions.json"))
+    parser.add_argument("--output", default=None, help="archivo JSON de salida (por defecto benchmarks/results/<fecha>.json)")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3, help="pasadas sobre el set de preguntas para las latencias")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None, help="procesos de ingesta (por defecto PDF_WORKERS)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="segundos que tarda el LLM simulado")
+    parser.add_argument("--web-latency", type=float, default=0.0, help="segundos que tarda la búsqueda web simulada")
+    parser.add_argument("--concurrency", type=int, default=16, help="hilos para el benchmark de encoding concurrente")
+    parser.add_argument("--warm", action="store_true", help="no limpiar los caches entre consultas")
+    parser.add_argument("--skip-e2e", action="store_true")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ceut-bench-")
+    # Los módulos de la app loguean y trazan en rutas relativas: todo queda en el directorio temporal
+    os.environ.setdefault("RAG_TRACE_FILE", os.path.join(workdir, "traces.jsonl"))
+    os.makedirs(os.path.join(workdir, "logs"), exist_ok=True)
+    data_dir, questions_path = os.path.abspath(args.data), os.path.abspath(args.questions)
+    output = os.path.abspath(args.output) if args.output else os.path.join(ROOT, "benchmarks", "results", f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.chdir(workdir)
+    sys.path.insert(0, APP_DIR)
+
+    with open(questions_path, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    report: Dict = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "embedding_backend": os.getenv("EMBEDDING_BACKEND", "torch"),
+            "reranker": os.getenv("RAG_RERANKER", "on"),
+        },
+        "config": vars(args),
+    }
+    try:
+        start = time.perf_counter()
+        tools = make_stub_tools(args.web_latency)
+        from rag import RAG
+        rag = RAG(persist_directory=os.path.join(workdir, "chroma_db"), tools=tools)
+        if rag.reranker is not None:
+            rag.reranker.warmup()  # igual que startup.cargar_recursos
+        report["startup_seconds"] = round(time.perf_counter() - start, 3)
+
+        ingestion = bench_ingestion(tools, data_dir, args.workers)
+        report["ingestion"] = ingestion["report"]
+        chunks = ingestion["chunks"]
+        report["embeddings"] = bench_embeddings(rag, [c.content for c in chunks], args.batch_size)
+        report["indexing"] = bench_indexing(rag, chunks, args.batch_size)
+        report["concurrent_encode"] = bench_concurrent_encode(rag, questions, args.concurrency, args.repeat)
+        report["search"] = bench_search(rag, questions, args.top_k, args.repeat, args.warm)
+        if not args.skip_e2e:
+            report["end_to_end"] = bench_end_to_end(rag, questions, args.repeat, args.llm_latency, args.warm)
+        report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps({k: v for k, v in report.items() if k not in ("config", "environment")}, indent=2, ensure_ascii=False))
+    print(f"\nResultados guardados en {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()